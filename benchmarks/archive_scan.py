@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+归档存储基准：生成一批归档对话，比较散文件与打包为段文件（archive_store.py）后的
+文件数、占用的磁盘空间、列出全部对话（history_index.chat_files）与按名称读取单个对话的耗时。
+
+    python3 benchmarks/archive_scan.py --chats 2000 --turns 6
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from wire_formats import sample_tokens
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from archive_store import index_cache, pack, select_codec  # noqa: E402
+from chat_store import read_chat, write_chat  # noqa: E402
+from history_index import chat_files  # noqa: E402
+
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def make_archives(archive_dir, chats, turns, answer_tokens):
+    os.makedirs(archive_dir)
+    tokens = sample_tokens(answer_tokens * 4)
+    rng = random.Random(0)
+    for index in range(chats):
+        messages = []
+        for turn in range(turns):
+            start = rng.randrange(len(tokens) - answer_tokens)
+            messages.append({"role": "user", "content": f"Question {index}.{turn}"})
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": "".join(tokens[start : start + answer_tokens]),
+                }
+            )
+        name = f"2024.01.01.00.00.00-{index:08x}.json"
+        write_chat(os.path.join(archive_dir, name), messages)
+
+
+def disk_usage(archive_dir):
+    """返回 (文件数, 分配的字节数)"""
+    files = [entry for entry in os.scandir(archive_dir) if entry.is_file()]
+    return len(files), sum(entry.stat().st_blocks * 512 for entry in files)
+
+
+def cold(func):
+    """每个 Alfred 动作都是新进程，测量前清空段索引的进程内缓存"""
+
+    def run():
+        index_cache.clear()
+        func()
+
+    return run
+
+
+def measure(data_dir, names, repeat):
+    archive_dir = os.path.join(data_dir, "archive")
+    count, usage = disk_usage(archive_dir)
+    scan = best_of(repeat, cold(lambda: chat_files(data_dir)))
+    paths = [os.path.join(archive_dir, name) for name in names]
+    read = min(best_of(repeat, cold(lambda: read_chat(path))) for path in paths)
+    return count, usage, scan, read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--answer-tokens", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        archive_dir = os.path.join(data_dir, "archive")
+        make_archives(archive_dir, args.chats, args.turns, args.answer_tokens)
+        names = random.Random(1).sample(sorted(os.listdir(archive_dir)), 20)
+
+        loose = measure(data_dir, names, args.repeat)
+        start = time.perf_counter()
+        pack(archive_dir)
+        pack_seconds = time.perf_counter() - start
+        packed = measure(data_dir, names, args.repeat)
+
+    print(
+        f"{args.chats} chats, codec {select_codec()[0]},"
+        f" packed in {pack_seconds * 1000:.0f} ms"
+    )
+    print(f"{'':<8} {'files':>7} {'disk KiB':>10} {'scan ms':>9} {'read ms':>9}")
+    for label, (count, usage, scan, read) in (("loose", loose), ("packed", packed)):
+        print(
+            f"{label:<8} {count:>7} {usage / 1024:>10.0f}"
+            f" {scan * 1000:>9.2f} {read * 1000:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+并行（fanout.py）与竞速（race.py）模式的离线检查：直接写入各服务商的流文件代替真实请求，
+检查胜者的判定、写入对话的内容与下一次提问发送的上下文。发现问题时打印原因并以非零状态退出。
+
+    python3 benchmarks/check_modes.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from wire_formats import PROVIDER_FORMATS, encode_stream, full_stream, sample_tokens
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+import chat  # noqa: E402
+import json_codec  # noqa: E402
+from chat_store import append_chat, read_chat, write_chat  # noqa: E402
+from fanout import progress_path, read_fanout, service_files  # noqa: E402
+from llm_service import LLMService  # noqa: E402
+from race import read_race  # noqa: E402
+
+OPENAI_401 = b'{"error":{"message":"Incorrect API key provided"}}'
+
+
+def seed(cache_dir, key, data):
+    """代替 start_stream：写入流文件，并清空 pid 与解析状态"""
+    stream_file, pid_file, state_file = service_files(cache_dir, key)
+    with open(stream_file, "wb") as file:
+        file.write(data)
+    with open(pid_file, "w") as file:
+        file.write("")
+    if os.path.exists(state_file):
+        os.remove(state_file)
+
+
+def start(cache_dir, keys):
+    progress = {"started": time.time(), "services": keys, "done": {}}
+    with open(progress_path(cache_dir), "w") as file:
+        file.write(json_codec.dumps(progress))
+    with open(os.path.join(cache_dir, "stream.txt"), "w") as file:
+        file.write("")
+
+
+def poll(read, data_dir, cache_dir):
+    return json_codec.loads(
+        read(
+            cache_dir,
+            os.path.join(data_dir, "chat.json"),
+            os.path.join(cache_dir, "stream.txt"),
+            os.path.join(cache_dir, "pid.txt"),
+            False,
+            "",
+            "",
+        )
+    )
+
+
+def check_race_error_body(data_dir, cache_dir):
+    """当前服务商立即返回错误体时，由仍在正常输出的备选服务商胜出"""
+    head, events, tail = encode_stream("anthropic", sample_tokens(8))
+    seed(cache_dir, "openai", OPENAI_401)
+    seed(cache_dir, "anthropic", head + b"".join(events[:4]))
+    start(cache_dir, ["openai", "anthropic"])
+
+    output = poll(read_race, data_dir, cache_dir)
+    if not output.get("footer", "").startswith("Anthropic won"):
+        return f"expected Anthropic to win, got footer {output.get('footer')!r}"
+
+    with open(service_files(cache_dir, "anthropic")[0], "ab") as file:
+        file.write(b"".join(events[4:]) + tail)
+    output = poll(read_race, data_dir, cache_dir)
+    if "rerun" in output:
+        return "race did not finish after the winner's stream ended"
+
+    answers = read_chat(os.path.join(data_dir, "chat.json"))
+    expected = [
+        {
+            "role": "assistant",
+            "content": "".join(sample_tokens(8)),
+            "provider": "Anthropic",
+        }
+    ]
+    if answers != expected:
+        return f"unexpected chat {answers!r}"
+    return None
+
+
+def sent_messages(query):
+    """运行一次 chat.py 的提问，返回各服务商请求体中的 messages（不实际发出请求）"""
+    requests = []
+    launch_stream = LLMService.launch_stream
+    LLMService.launch_stream = lambda self, request, *args: requests.append(request)
+    try:
+        chat.run([query])
+    finally:
+        LLMService.launch_stream = launch_stream
+    return [data["messages"] for _, _, data in requests]
+
+
+def check_fanout_context(data_dir, cache_dir):
+    """并行模式的一轮问答之后，下一次提问的上下文中每个问题只带一条回答（当前服务商的）"""
+    keys = ["openai", "anthropic"]
+    os.environ.update(
+        selected_llm_service="anthropic",
+        fanout_services=",".join(keys),
+        max_context="10",
+        max_tokens="100",
+    )
+    answers = {"openai": sample_tokens(6), "anthropic": sample_tokens(9)}
+    append_chat(os.path.join(data_dir, "chat.json"), {"role": "user", "content": "Q1"})
+    for key in keys:
+        seed(cache_dir, key, full_stream(PROVIDER_FORMATS[key], answers[key]))
+    start(cache_dir, keys)
+    if "rerun" in poll(read_fanout, data_dir, cache_dir):
+        return "fan-out did not finish"
+
+    expected = ["Q1", "".join(answers["anthropic"]), "Q2"]
+    for budget in ("", "4096"):
+        os.environ["context_tokens"] = budget
+        for messages in sent_messages("Q2"):
+            contents = [message["content"] for message in messages]
+            if contents != expected:
+                return f"context_tokens={budget!r}: sent {contents!r}"
+        # 撤销本次提问，下一种预算重新从同一段对话开始
+        chat_file = os.path.join(data_dir, "chat.json")
+        write_chat(chat_file, read_chat(chat_file)[:-1])
+        os.remove(os.path.join(cache_dir, "stream.txt"))
+    return None
+
+
+CHECKS = [check_race_error_body, check_fanout_context]
+
+
+def main():
+    failures = 0
+    for check in CHECKS:
+        with tempfile.TemporaryDirectory() as workdir:
+            data_dir = os.path.join(workdir, "data")
+            cache_dir = os.path.join(workdir, "cache")
+            os.makedirs(data_dir)
+            os.makedirs(cache_dir)
+            os.environ.update(
+                alfred_workflow_data=data_dir, alfred_workflow_cache=cache_dir
+            )
+            failure = check(data_dir, cache_dir)
+        if failure:
+            failures += 1
+        print(f"{check.__name__:<28} {failure or 'ok'}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+解析器语料：各服务商线上格式的合成抓包，按 1 KB / 100 KB / 5 MB 三档大小生成，另附边界情况样本
+（未结束的尾行、缺少 [DONE]、不含 choices 的心跳分片、SSE 中途报错、CRLF 换行、事件间没有空行、一次性错误体等）。
+
+    python3 benchmarks/corpus.py --write /tmp/corpus   # 把语料写成文件，便于检查或用 curl 回放
+"""
+
+import argparse
+import json
+import os
+
+from wire_formats import PROVIDER_FORMATS, encode_stream, full_stream, sample_tokens
+
+SIZES = {"1k": 1024, "100k": 100 * 1024, "5m": 5 * 1024 * 1024}
+
+
+def sized_stream(kind, target_bytes):
+    """生成不小于 target_bytes 的完整流"""
+    probe = len(full_stream(kind, sample_tokens(64)))
+    count = max(1, int(target_bytes / (probe / 64)) + 1)
+    return full_stream(kind, sample_tokens(count))
+
+
+def sse_error(kind):
+    head, events, _ = encode_stream(kind, sample_tokens(8))
+    if kind == "anthropic":
+        error = (
+            b'event: error\ndata: {"type":"error","error":'
+            b'{"type":"overloaded_error","message":"Overloaded"}}\n\n'
+        )
+    elif kind == "qwen":
+        error = b'id:9\nevent:error\ndata:{"code":"Throttling","message":"quota"}\n\n'
+    elif kind == "ollama":
+        error = b'{"error":"model runner crashed"}\n'
+    else:
+        error = b'data: {"error":{"message":"upstream error"}}\n\n'
+    return head + b"".join(events) + error
+
+
+ERROR_BODIES = {
+    "openai": b'{"error": {"message": "Incorrect API key provided", "type": "invalid_request_error"}}',
+    "anthropic": b'{"type":"error","error":{"type":"authentication_error","message":"invalid x-api-key"}}',
+    "gemini": b'{\n  "error": {\n    "code": 400,\n    "message": "API key not valid"\n  }\n}\n',
+    "qwen": b'{"code":"InvalidApiKey","message":"Invalid API-key provided.","request_id":"1"}',
+    "ollama": b'{"error":"model \\"mock\\" not found"}\n',
+}
+
+
+def edge_cases(kind):
+    head, events, tail = encode_stream(kind, sample_tokens(24))
+    body = head + b"".join(events)
+    cases = {
+        "complete": body + tail,
+        "truncated": body + events[0][: len(events[0]) // 2],
+        "no_tail": body,
+        "error_body": ERROR_BODIES[kind],
+    }
+    if kind != "gemini":
+        cases["sse_error"] = sse_error(kind)
+    if kind != "ollama":
+        cases["crlf"] = (body + tail).replace(b"\n", b"\r\n")
+    if kind == "openai":
+        cases["no_done"] = body + tail.replace(b"data: [DONE]\n\n", b"")
+        cases["length"] = body + tail.replace(b'"stop"', b'"length"')
+        # 部分 OpenAI 兼容服务的 data 行之间没有空行
+        cases["no_blank_lines"] = (body + tail).replace(b"\n\n", b"\n")
+    return cases
+
+
+def provider_corpus(provider, sizes=("1k", "100k", "5m")):
+    """返回 {样本名: 字节流}"""
+    kind = PROVIDER_FORMATS[provider]
+    corpus = {f"size_{name}": sized_stream(kind, SIZES[name]) for name in sizes}
+    corpus.update(edge_cases(kind))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--write", metavar="DIR", required=True)
+    args = parser.parse_args()
+    for provider in PROVIDER_FORMATS:
+        directory = os.path.join(args.write, provider)
+        os.makedirs(directory, exist_ok=True)
+        for name, stream in provider_corpus(provider).items():
+            with open(os.path.join(directory, f"{name}.txt"), "wb") as file:
+                file.write(stream)
+    print(json.dumps(sorted(os.listdir(args.write))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+"""
+增量解析与整体解析的等价性检查。
+
+对 1 KB 语料与全部边界样本，在每一个字节处截断：
+  1. 先读到截断处再读完整个流，结果必须与一次性解析整个流相同；
+  2. 读到截断处时展示的结果必须与一次性解析该前缀相同。
+较大的语料改用 --trials 组随机切分。发现不一致时打印样本并以非零状态退出。
+
+    python3 benchmarks/fuzz_parsers.py --trials 50 --seed 1
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+from corpus import provider_corpus
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from providers import PROVIDERS, load_service  # noqa: E402
+
+
+def full_parse(service, stream):
+    return tuple(service.parse_stream_response(stream.decode("utf-8", errors="ignore")))
+
+
+def feed(service, stream, cuts):
+    """依次读到各切分点（最后一个为全长），返回每个切分点展示的结果"""
+    state = service.new_stream_state()
+    views = []
+    for cut in cuts:
+        views.append(
+            tuple(service.advance_stream_state(stream[state["offset"] : cut], state))
+        )
+        # 与 read_stream 一样，状态在两次 rerun 之间经 JSON 保存
+        state = json.loads(json.dumps(state))
+    return views
+
+
+def check_every_byte(service, stream):
+    expected = full_parse(service, stream)
+    for cut in range(1, len(stream)):
+        prefix_view, final_view = feed(service, stream, [cut, len(stream)])
+        if final_view != expected:
+            return cut, "final", final_view, expected
+        prefix_expected = full_parse(service, stream[:cut])
+        if prefix_view != prefix_expected:
+            return cut, "prefix", prefix_view, prefix_expected
+    return None
+
+
+def check_random(service, stream, trials, rng):
+    expected = full_parse(service, stream)
+    for _ in range(trials):
+        count = rng.randint(1, 64)
+        cuts = sorted(rng.sample(range(1, len(stream)), min(count, len(stream) - 1)))
+        final_view = feed(service, stream, cuts + [len(stream)])[-1]
+        if final_view != expected:
+            return cuts, "final", final_view, expected
+    return None
+
+
+def short(result):
+    text, error, stopped = result
+    return (text[:40] + ("…" if len(text) > 40 else ""), error, stopped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--provider", choices=list(PROVIDERS), action="append")
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failures = 0
+    for provider in args.provider or PROVIDERS:
+        service = load_service(provider, "", "")
+        corpus = provider_corpus(provider, ("1k", "100k"))
+        for name, stream in corpus.items():
+            if name == "size_100k":
+                failure = check_random(service, stream, args.trials, rng)
+            else:
+                failure = check_every_byte(service, stream)
+            status = "ok"
+            if failure:
+                failures += 1
+                cut, kind, got, expected = failure
+                status = f"MISMATCH ({kind}) at {cut}: {short(got)} != {short(expected)}"
+            print(f"{provider:<10} {name:<12} {len(stream):>8} bytes  {status}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""
+JSON 后端基准：对每个可用后端（orjson / ujson / json）测量
+  - 一次流式 rerun 中的 JSON 开销：读写流状态、解析本次新到的分片、输出给 Alfred 的 JSON；
+  - 打开大对话时逐行解析对话文件并输出整段对话的开销；
+  - 在新进程中导入该后端的耗时（每次 rerun 都要付出），
+并据此估算加速后端划算的单个载荷大小，对照 json_codec.LARGE_PAYLOAD。
+
+    python3 benchmarks/json_tick.py --turns 200 --ascii
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from wire_formats import sample_tokens
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from helper import assistant_signature, markdown_chat  # noqa: E402
+from json_codec import BACKENDS, LARGE_PAYLOAD, make_codec, stdlib_dumps  # noqa: E402
+
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def import_ms(name, runs=5):
+    """新进程中在标准库 json 之后导入后端的耗时（取中位数），标准库本身记为 0"""
+    if name == "json":
+        return 0.0
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import json, {name}"],
+            capture_output=True,
+            text=True,
+        )
+        for line in result.stderr.splitlines():
+            if line.endswith(f"| {name}"):
+                timings.append(int(line.split("|")[1]) / 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def large_work(loads, dumps, state_json):
+    """大载荷：读写一次流状态"""
+    dumps(loads(state_json), ensure_ascii=False)
+
+
+def build_chat(turns, answer_tokens, ascii_only):
+    tokens = sample_tokens(answer_tokens)
+    if ascii_only:
+        tokens = [token if token.isascii() else " text" for token in tokens]
+    answer = "".join(tokens)
+    messages = []
+    for index in range(turns):
+        messages.append({"role": "user", "content": f"Question {index}"})
+        messages.append({"role": "assistant", "content": answer})
+    return messages, tokens
+
+
+def tick_work(loads, dumps, state_json, chunks, response_text):
+    """一次 streaming rerun：读状态、解析新分片、写状态、输出 replacelast 响应"""
+    state = loads(state_json)
+    for chunk in chunks:
+        loads(chunk)
+    dumps(state, ensure_ascii=False)
+    dumps(
+        {
+            "rerun": 0.1,
+            "variables": {"streaming_now": True},
+            "response": assistant_signature() + response_text,
+            "behaviour": {"response": "replacelast"},
+        },
+        ensure_ascii=False,
+    )
+
+
+def open_work(loads, dumps, chat_lines, markdown):
+    """打开对话：逐行解析对话文件，输出整段渲染后的对话"""
+    for line in chat_lines:
+        loads(line)
+    dumps({"response": markdown, "behaviour": {"scroll": "end"}}, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--answer-tokens", type=int, default=800)
+    parser.add_argument("--chunks", type=int, default=32, help="new chunks per tick")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--ascii", action="store_true", help="use ASCII-only text (no CJK/emoji)"
+    )
+    args = parser.parse_args()
+
+    messages, tokens = build_chat(args.turns, args.answer_tokens, args.ascii)
+    chat_lines = [stdlib_dumps(message, ensure_ascii=False) for message in messages]
+    markdown = markdown_chat(messages)
+    response_text = messages[-1]["content"]
+    state_json = stdlib_dumps(
+        {"offset": 123456, "text": response_text, "error": None, "stopped": False}
+    )
+    chunks = [
+        stdlib_dumps(
+            {"choices": [{"delta": {"content": token}, "finish_reason": None}]},
+            ensure_ascii=False,
+        )
+        for token in tokens[: args.chunks]
+    ]
+    print(
+        f"chat {len(markdown) / 1e6:.2f}M chars, response {len(response_text)} chars,"
+        f" {args.chunks} chunks per tick"
+    )
+
+    large_text = (response_text * (2 * 1024 * 1024 // len(response_text) + 1))[
+        : 2 * 1024 * 1024
+    ]
+    large_json = stdlib_dumps(
+        {"offset": 1, "text": large_text, "error": None, "stopped": False},
+        ensure_ascii=False,
+    )
+
+    results = {}
+    for name in BACKENDS:
+        try:
+            loads, dumps = make_codec(name)
+        except ImportError:
+            continue
+        results[name] = {
+            "import": import_ms(name),
+            "tick": best_of(
+                args.repeat,
+                lambda: tick_work(loads, dumps, state_json, chunks, response_text),
+            ),
+            "open": best_of(
+                args.repeat, lambda: open_work(loads, dumps, chat_lines, markdown)
+            ),
+            "large": best_of(3, lambda: large_work(loads, dumps, large_json)),
+        }
+
+    stdlib = results["json"]
+    print(
+        f"{'backend':<8} {'import ms':>9} {'tick ms':>8} {'saving':>7}"
+        f" {'open chat ms':>13} {'saving':>7} {'2M state ms':>12} {'break-even':>11}"
+    )
+    for name in BACKENDS:
+        if name not in results:
+            print(f"{name:<8} not installed")
+            continue
+        r = results[name]
+        # 单个载荷每个字符省下的时间抵消导入耗时所需的大小
+        saved_per_char = (stdlib["large"] - r["large"]) / len(large_text)
+        if name == "json":
+            break_even = "-"
+        elif saved_per_char <= 0:
+            break_even = "never"
+        else:
+            break_even = f"{r['import'] / 1000 / saved_per_char / 1e6:.1f}M chars"
+        print(
+            f"{name:<8} {r['import']:>9.2f} {r['tick'] * 1000:>8.3f}"
+            f" {1 - r['tick'] / stdlib['tick']:>7.0%}"
+            f" {r['open'] * 1000:>13.2f} {1 - r['open'] / stdlib['open']:>7.0%}"
+            f" {r['large'] * 1000:>12.2f} {break_even:>11}"
+        )
+    print(f"json_codec.LARGE_PAYLOAD = {LARGE_PAYLOAD / 1e6:.1f}M chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+"""
+本地替身服务器：按请求路径以对应服务商的线上格式回放流式响应，可设定首 token 延迟、token 速率与分片大小。
+
+    python3 benchmarks/mock_server.py --port 8765 --rate 60 --tokens 400 --chunk-size 0
+
+把各服务商的 API Endpoint 指向 http://127.0.0.1:8765 即可离线运行工作流；API Key 可任意填写。
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from wire_formats import encode_stream, route, sample_tokens
+
+
+class StreamSettings:
+    def __init__(self, rate=60.0, tokens=400, chunk_size=0, ttft_ms=300.0):
+        self.rate = rate
+        self.tokens = tokens
+        # 0 表示每个 token 单独写出一次；否则把字节流按固定大小切分（模拟代理或 TCP 合并）
+        self.chunk_size = chunk_size
+        self.ttft_ms = ttft_ms
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def write_chunk(self, data):
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        settings = self.server.settings
+        kind = route(self.path)
+        head, events, tail = encode_stream(kind, sample_tokens(settings.tokens))
+        self.server.last_stream = head + b"".join(events) + tail
+
+        self.send_response(200)
+        content_type = "application/json" if kind == "gemini" else "text/event-stream"
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        started = time.perf_counter()
+        interval = 1.0 / settings.rate if settings.rate > 0 else 0.0
+        pending = head
+        for index, event in enumerate(events):
+            # 以请求开始时间为基准排程，避免 sleep 误差逐步累积
+            due = started + settings.ttft_ms / 1000 + index * interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pending += event
+            if not settings.chunk_size:
+                self.write_chunk(pending)
+                pending = b""
+                continue
+            while len(pending) >= settings.chunk_size:
+                self.write_chunk(pending[: settings.chunk_size])
+                pending = pending[settings.chunk_size :]
+        self.write_chunk(pending + tail)
+        self.wfile.write(b"0\r\n\r\n")
+        self.server.finished_at = time.perf_counter()
+
+
+def start_server(port=0, settings=None):
+    """在后台线程中启动服务器，返回 server；server.server_address[1] 为实际端口"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.settings = settings or StreamSettings()
+    server.last_stream = b""
+    server.finished_at = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=60.0, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--chunk-size", type=int, default=0)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    settings = StreamSettings(args.rate, args.tokens, args.chunk_size, args.ttft_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    server.settings = settings
+    print(f"Serving mock providers on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+解析器微基准：对每个服务商、每档语料大小测量整体解析（parse_stream_response）
+与按 rerun 分块的增量解析（advance_stream_state）的吞吐。
+
+    python3 benchmarks/parsers.py --size 1k --size 100k --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from corpus import SIZES, provider_corpus
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from providers import PROVIDERS, load_service  # noqa: E402
+
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_full(service, stream):
+    service.parse_stream_response(stream.decode("utf-8", errors="replace"))
+
+
+def parse_incremental(service, stream, chunk_size):
+    """模拟 rerun：每次读取 offset 之后到当前已写入位置的字节，状态经 JSON 往返保存"""
+    state = service.new_stream_state()
+    for end in range(chunk_size, len(stream) + chunk_size, chunk_size):
+        service.advance_stream_state(stream[state["offset"] : end], state)
+        state = json.loads(json.dumps(state))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--provider", choices=list(PROVIDERS), action="append")
+    parser.add_argument("--size", choices=list(SIZES), action="append")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--chunk-size", type=int, default=4096, help="bytes per simulated rerun"
+    )
+    args = parser.parse_args()
+    sizes = args.size or list(SIZES)
+
+    print(f"{'provider':<10} {'size':>5} {'full MB/s':>10} {'incremental MB/s':>17}")
+    for provider in args.provider or PROVIDERS:
+        service = load_service(provider, "", "")
+        corpus = provider_corpus(provider, sizes)
+        for size in sizes:
+            stream = corpus[f"size_{size}"]
+            megabytes = len(stream) / 1e6
+            full = best_of(args.repeat, lambda: parse_full(service, stream))
+            incremental = best_of(
+                args.repeat,
+                lambda: parse_incremental(service, stream, args.chunk_size),
+            )
+            print(
+                f"{provider:<10} {size:>5} {megabytes / full:>10.1f}"
+                f" {megabytes / incremental:>17.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+rerun 启动开销基准：以流式读取（streaming_now=1）的方式运行 src/chat.py，
+借助 `python -X importtime` 统计导入耗时，并给出整个进程的墙钟时间。
+
+    python3 benchmarks/startup.py --runs 20 --budget-ms 25
+
+导入耗时的中位数超过 --budget-ms 时以非零状态退出，便于在 CI 中发现回归。
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+PROVIDERS = ["openai", "anthropic", "gemini", "qwen", "ollama", "deepseek", "chatglm"]
+
+
+def parse_importtime(stderr):
+    """返回 {顶层模块: 累计微秒}，只统计 -X importtime 输出中缩进为一级的模块"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.startswith(" ") and not name.startswith("  "):
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def run_tick(env):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(SRC_DIR, "chat.py"), ""],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return elapsed, parse_importtime(result.stderr)
+
+
+def bench_provider(provider, runs, workdir):
+    cache_dir = os.path.join(workdir, "cache")
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+    env = dict(
+        os.environ,
+        alfred_workflow_cache=cache_dir,
+        alfred_workflow_data=data_dir,
+        selected_llm_service=provider,
+        max_context="24",
+        max_tokens="2048",
+        streaming_now="1",
+    )
+
+    walls, imports, by_module = [], [], {}
+    for _ in range(runs):
+        # 每次都放一个空的流文件，模拟等待首个字节时的 rerun
+        open(os.path.join(cache_dir, "stream.txt"), "w").close()
+        elapsed, modules = run_tick(env)
+        walls.append(elapsed * 1000)
+        imports.append(sum(modules.values()) / 1000)
+        for name, micros in modules.items():
+            by_module.setdefault(name, []).append(micros / 1000)
+    return walls, imports, by_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=0)
+    parser.add_argument("--provider", choices=PROVIDERS, action="append")
+    parser.add_argument("--top", type=int, default=5, help="show the slowest N modules")
+    args = parser.parse_args()
+
+    over_budget = False
+    with tempfile.TemporaryDirectory() as workdir:
+        for provider in args.provider or PROVIDERS:
+            walls, imports, by_module = bench_provider(provider, args.runs, workdir)
+            import_ms = statistics.median(imports)
+            print(
+                f"{provider:<10} wall {statistics.median(walls):7.1f} ms"
+                f"  imports {import_ms:6.1f} ms"
+            )
+            slowest = sorted(
+                by_module.items(), key=lambda item: -statistics.median(item[1])
+            )
+            for name, values in slowest[: args.top]:
+                print(f"    {name:<24} {statistics.median(values):6.1f} ms")
+            if args.budget_ms and import_ms > args.budget_ms:
+                over_budget = True
+
+    if over_budget:
+        print(f"Import time exceeded the {args.budget_ms} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+端到端流式基准：启动本地替身服务器，像 Alfred 一样反复运行 src/chat.py 直到回答结束。
+
+    python3 benchmarks/stream_e2e.py --rate 60 --tokens 400 --chunk-size 0
+
+每个服务商报告：rerun 次数、单次 rerun 的墙钟耗时、子进程 CPU 总耗时、每次 rerun 的解析耗时、
+首次显示内容的时间与完整显示回答的时间（以及相对服务器发送完毕的滞后）。
+解析耗时在本进程中按各次 rerun 实际读到的字节边界重放 advance_stream_state 得出。
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_server import StreamSettings, start_server
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+PROVIDERS = ["openai", "anthropic", "gemini", "qwen", "ollama", "deepseek", "chatglm"]
+
+
+def child_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_chat(env, query, variables):
+    result = subprocess.run(
+        [sys.executable, os.path.join(SRC_DIR, "chat.py"), query],
+        env=dict(env, **variables),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout)
+
+
+def ask(env, stream_file, honor_rerun):
+    """返回 (各次 rerun 的记录, 首次显示内容的时间, 完整显示的时间)"""
+    started = time.perf_counter()
+    output = run_chat(env, "Benchmark question", {})
+    ticks = []
+    first_render = None
+    while "rerun" in output:
+        if honor_rerun:
+            time.sleep(output["rerun"])
+        variables = output.get("variables", {})
+        size = os.path.getsize(stream_file) if os.path.exists(stream_file) else None
+        tick_start = time.perf_counter()
+        output = run_chat(
+            env,
+            "",
+            {
+                "streaming_now": "1" if variables.get("streaming_now") else "",
+                "stream_marker": "1" if variables.get("stream_marker") else "",
+            },
+        )
+        now = time.perf_counter()
+        ticks.append({"wall": now - tick_start, "size": size})
+        response = output.get("response", "")
+        if first_render is None and response and not response.endswith("..."):
+            first_render = now - started
+    return ticks, first_render, time.perf_counter() - started
+
+
+def replay_parse(provider, stream, sizes):
+    """按各次 rerun 读到的文件大小重放增量解析，返回每次的解析耗时（秒）"""
+    sys.path.insert(0, SRC_DIR)
+    from providers import load_service
+
+    service = load_service(provider, "", "")
+    state = service.new_stream_state()
+    timings = []
+    for size in sizes:
+        data = stream[state["offset"] : size]
+        if not data:
+            continue
+        start = time.perf_counter()
+        service.advance_stream_state(data, state)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_provider(provider, server, args, workdir):
+    cache_dir = os.path.join(workdir, provider, "cache")
+    data_dir = os.path.join(workdir, provider, "data")
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    env = dict(
+        os.environ,
+        alfred_workflow_cache=cache_dir,
+        alfred_workflow_data=data_dir,
+        selected_llm_service=provider,
+        max_context="24",
+        max_tokens="2048",
+        **{
+            f"{provider}_api_endpoint": endpoint,
+            f"{provider}_api_key": "mock",
+            f"{provider}_model": "mock",
+        },
+    )
+    env.update(item.split("=", 1) for item in args.env)
+
+    server.finished_at = None
+    cpu_before = child_cpu()
+    ticks, first_render, full_render = ask(
+        env, os.path.join(cache_dir, "stream.txt"), not args.no_wait
+    )
+    cpu = child_cpu() - cpu_before
+    render_lag = None
+    if server.finished_at is not None:
+        render_lag = time.perf_counter() - server.finished_at
+
+    sizes = [tick["size"] for tick in ticks if tick["size"]]
+    parse = replay_parse(provider, server.last_stream, sizes) or [0.0]
+    walls = [tick["wall"] * 1000 for tick in ticks]
+    return {
+        "ticks": len(ticks),
+        "tick_p50": statistics.median(walls),
+        "tick_max": max(walls),
+        "cpu": cpu * 1000,
+        "parse_p50": statistics.median(parse) * 1000,
+        "parse_max": max(parse) * 1000,
+        "first_render": (first_render or 0) * 1000,
+        "full_render": full_render * 1000,
+        "render_lag": (render_lag or 0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--provider", choices=PROVIDERS, action="append")
+    parser.add_argument("--rate", type=float, default=60.0, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--chunk-size", type=int, default=0)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument(
+        "--no-wait", action="store_true", help="rerun immediately instead of sleeping"
+    )
+    parser.add_argument(
+        "--env", action="append", default=[], help="extra KEY=VALUE workflow variable"
+    )
+    args = parser.parse_args()
+
+    settings = StreamSettings(args.rate, args.tokens, args.chunk_size, args.ttft_ms)
+    server = start_server(0, settings)
+    print(
+        f"{'provider':<10} {'ticks':>5} {'tick p50':>9} {'tick max':>9} {'cpu':>8}"
+        f" {'parse p50':>10} {'parse max':>10} {'first':>8} {'full':>8} {'lag':>7}"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        for provider in args.provider or PROVIDERS:
+            r = bench_provider(provider, server, args, workdir)
+            print(
+                f"{provider:<10} {r['ticks']:>5} {r['tick_p50']:>7.1f}ms"
+                f" {r['tick_max']:>7.1f}ms {r['cpu']:>6.0f}ms"
+                f" {r['parse_p50']:>8.3f}ms {r['parse_max']:>8.3f}ms"
+                f" {r['first_render']:>6.0f}ms {r['full_render']:>6.0f}ms"
+                f" {r['render_lag']:>5.0f}ms"
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+各服务商流式响应的线上格式（与真实接口抓包一致的结构），供本地替身服务器与基准测试使用。
+
+encode_stream(kind, tokens) 返回 (head, events, tail)：events 中每一项对应一个 token，
+替身服务器按 token 速率逐项发送。
+"""
+
+import json
+
+# 混合 ASCII、中日韩文字与 emoji，覆盖多字节 UTF-8 被截断的情况
+TOKEN_CYCLE = ["The", " quick", " brown", " fox", " 你好", "世界", " 😀", ",", "\n", " jumps"]
+
+
+def sample_tokens(count):
+    return [TOKEN_CYCLE[i % len(TOKEN_CYCLE)] for i in range(count)]
+
+
+def sse(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def encode_openai(tokens):
+    # 首个分片只有 role，并夹带一个不含 choices 的心跳分片（部分兼容接口会发送）
+    head = sse({"choices": [{"delta": {"role": "assistant"}, "finish_reason": None}]})
+    head += sse({"id": "heartbeat", "choices": []})
+    events = [
+        sse({"choices": [{"delta": {"content": token}, "finish_reason": None}]})
+        for token in tokens
+    ]
+    tail = sse({"choices": [{"delta": {}, "finish_reason": "stop"}]}) + b"data: [DONE]\n\n"
+    return head, events, tail
+
+
+def encode_anthropic(tokens):
+    head = sse(
+        {"type": "message_start", "message": {"usage": {"input_tokens": 12}}},
+        "message_start",
+    )
+    head += sse(
+        {
+            "type": "content_block_start",
+            "index": 0,
+            "content_block": {"type": "text", "text": ""},
+        },
+        "content_block_start",
+    )
+    head += sse({"type": "ping"}, "ping")
+    events = [
+        sse(
+            {
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": token},
+            },
+            "content_block_delta",
+        )
+        for token in tokens
+    ]
+    tail = sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+    tail += sse(
+        {"type": "message_delta", "delta": {"stop_reason": "end_turn"}},
+        "message_delta",
+    )
+    tail += sse({"type": "message_stop"}, "message_stop")
+    return head, events, tail
+
+
+def encode_gemini(tokens):
+    # 一个缩进排版的 JSON 数组，元素之间以 "\r\n,\r\n" 分隔
+    parts = [
+        json.dumps(
+            {"candidates": [{"content": {"parts": [{"text": token}], "role": "model"}}]},
+            ensure_ascii=False,
+            indent=2,
+        ).encode("utf-8")
+        for token in tokens
+    ]
+    events = [b"[" + parts[0]] + [b"\r\n,\r\n" + part for part in parts[1:]]
+    return b"", events, b"]"
+
+
+def encode_qwen(tokens):
+    events = [
+        (
+            f"id:{index}\nevent:result\n:HTTP_STATUS/200\ndata:"
+            + json.dumps(
+                {
+                    "output": {
+                        "choices": [
+                            {
+                                "message": {"role": "assistant", "content": token},
+                                "finish_reason": "null",
+                            }
+                        ]
+                    }
+                },
+                ensure_ascii=False,
+            )
+            + "\n\n"
+        ).encode("utf-8")
+        for index, token in enumerate(tokens)
+    ]
+    tail = (
+        f"id:{len(tokens)}\nevent:result\n:HTTP_STATUS/200\ndata:"
+        + json.dumps(
+            {
+                "output": {
+                    "choices": [
+                        {
+                            "message": {"role": "assistant", "content": ""},
+                            "finish_reason": "stop",
+                        }
+                    ]
+                }
+            }
+        )
+        + "\n\n"
+    ).encode("utf-8")
+    return b"", events, tail
+
+
+def encode_ollama(tokens):
+    events = [
+        (
+            json.dumps(
+                {
+                    "model": "mock",
+                    "message": {"role": "assistant", "content": token},
+                    "done": False,
+                },
+                ensure_ascii=False,
+            )
+            + "\n"
+        ).encode("utf-8")
+        for token in tokens
+    ]
+    tail = (
+        json.dumps(
+            {"model": "mock", "message": {"role": "assistant", "content": ""}, "done": True}
+        )
+        + "\n"
+    ).encode("utf-8")
+    return b"", events, tail
+
+
+ENCODERS = {
+    "openai": encode_openai,
+    "anthropic": encode_anthropic,
+    "gemini": encode_gemini,
+    "qwen": encode_qwen,
+    "ollama": encode_ollama,
+}
+
+# 服务商 -> 线上格式；DeepSeek 与 ChatGLM 使用 OpenAI 兼容格式
+PROVIDER_FORMATS = {
+    "openai": "openai",
+    "anthropic": "anthropic",
+    "gemini": "gemini",
+    "qwen": "qwen",
+    "ollama": "ollama",
+    "deepseek": "openai",
+    "chatglm": "openai",
+}
+
+
+def route(path):
+    """按请求路径判断应答的线上格式"""
+    if path.endswith("/v1/messages"):
+        return "anthropic"
+    if ":streamGenerateContent" in path:
+        return "gemini"
+    if "/services/aigc/" in path:
+        return "qwen"
+    if path.endswith("/api/chat"):
+        return "ollama"
+    return "openai"
+
+
+def encode_stream(kind, tokens):
+    return ENCODERS[kind](tokens)
+
+
+def full_stream(kind, tokens):
+    head, events, tail = encode_stream(kind, tokens)
+    return head + b"".join(events) + tail
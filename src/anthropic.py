@@ -1,15 +1,39 @@
-import json
-import subprocess
 from typing import Optional, Tuple
 
-from helper import os, write_file
+import json_codec
 from llm_service import LLMService
 
+CACHE_CONTROL = {"type": "ephemeral"}
+# 除系统提示词外，在最近的几条用户消息上设置缓存断点（Anthropic 最多允许 4 个）
+CACHED_USER_MESSAGES = 2
+
+
+def with_cache_control(content):
+    return [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+
+
+def cache_breakpoints(messages):
+    """
+    在最近的 CACHED_USER_MESSAGES 条用户消息上设置断点：最后一条写入本次的完整前缀，
+    上一轮写入的前缀止于倒数第二条，下一次提问时可以直接命中。断点随对话向后滑动。
+    """
+    messages = list(messages)
+    marked = 0
+    for index in range(len(messages) - 1, -1, -1):
+        if marked == CACHED_USER_MESSAGES:
+            break
+        message = messages[index]
+        if message["role"] == "user" and isinstance(message["content"], str):
+            content = with_cache_control(message["content"])
+            messages[index] = dict(message, content=content)
+            marked += 1
+    return messages
+
 
 class AnthropicService(LLMService):
-    def construct_curl_command(
-        self, max_tokens, messages, stream_file, system_prompt=None
-    ) -> list:
+    def build_request(self, max_tokens, messages, system_prompt=None):
+        if self.prompt_cache:
+            messages = cache_breakpoints(messages)
         data = {
             "model": self.model,
             "max_tokens": max_tokens,
@@ -17,106 +41,64 @@ class AnthropicService(LLMService):
             "stream": True,
         }
 
-        if system_prompt:
+        if system_prompt and self.prompt_cache:
+            data["system"] = with_cache_control(system_prompt)
+        elif system_prompt:
             data["system"] = system_prompt
 
-        return [
-            "curl",
-            f"{self.api_endpoint}/v1/messages",
-            "--speed-limit",
-            "0",
-            "--speed-time",
-            str(self.stall_timeout_sec),  # Abort stalled connection after a few seconds
-            "--silent",
-            "--no-buffer",
-            "--header",
-            "Content-Type: application/json",
-            "--header",
-            f"User-Agent: {self.user_agent}",
-            "--header",
-            f"x-api-key: {self.api_key}",
-            "--header",
-            "anthropic-version: 2023-06-01",
-            "--data",
-            json.dumps(data),
-            "--output",
-            stream_file,
-        ] + self.proxy_option
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": self.user_agent,
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+        }
+        return f"{self.api_endpoint}/v1/messages", headers, data
 
-    def parse_stream_response(self, stream_string) -> Tuple[str, Optional[str], bool]:
+    def parse_error_body(self, stream_string) -> Tuple[str, Optional[str], bool]:
         # 统一错误呈现：若为一次性 JSON 错误体，则直接回显可读错误信息
-        if stream_string.startswith("{"):
-            try:
-                obj = json.loads(stream_string)
-            except Exception:
-                return "Response body is not valid json.", "", True
-            err = obj.get("error") or {}
-            if err:
-                etype = err.get("type", "Error")
-                emsg = err.get("message", "Unknown Error")
-                return f"{etype}: {emsg}", "", True
-            return json.dumps(obj, ensure_ascii=False), "", True
-
-        lines = stream_string.strip().split("\n")
-
-        chunks = []
-        current_event = {}
-
-        for line in lines:
-            if line.startswith("event:"):
-                current_event = {}
-                current_event["event"] = line[len("event: ") :].strip()
-            elif line.startswith("data:"):
-                data = line[len("data: ") :].strip()
-                try:
-                    current_event["data"] = json.loads(data)
-                except json.JSONDecodeError:
-                    current_event["data"] = None
-                chunks.append(current_event)
-
-        response_text = ""
-        finish_reason = None
-        has_stopped = False
-        for current_event in chunks:
-            if current_event["event"] == "content_block_start":
-                response_text = response_text + current_event["data"].get(
-                    "content_block", {}
-                ).get("text", "")
-            elif current_event["event"] == "content_block_delta":
-                response_text = response_text + current_event["data"].get(
-                    "delta", {}
-                ).get("text", "")
-            elif current_event["event"] == "message_stop":
-                has_stopped = True
-                finish_reason = "Finished"
-                break
-            elif current_event["event"] == "error":
-                # 直接回显错误详情并终止
-                err_obj = (
-                    current_event["data"].get("error", {})
-                    if current_event.get("data")
-                    else {}
-                )
-                etype = err_obj.get("type", "Error")
-                emsg = err_obj.get("message", "Unknown Error")
-                return f"{etype}: {emsg}", "", True
-
-        # 非错误结束场景下仅返回内容；错误已在上面直接回显
-        return response_text, None, has_stopped
-
-    def start_stream(
-        self, max_tokens, system_prompt, context_chat, stream_file, pid_stream_file
-    ):
-        write_file(stream_file, "")
-
-        while len(context_chat) > 0 and context_chat[0]["role"] == "assistant":
-            context_chat.pop(0)
-
-        curl_command = self.construct_curl_command(
-            max_tokens, context_chat, stream_file, system_prompt
-        )
-
-        with open(os.devnull, "w") as devnull:
-            process = subprocess.Popen(curl_command, stdout=devnull, stderr=devnull)
-
-        write_file(pid_stream_file, str(process.pid))
+        try:
+            obj = json_codec.loads(stream_string)
+        except Exception:
+            return "Response body is not valid json.", "", True
+        err = obj.get("error") or {}
+        if err:
+            etype = err.get("type", "Error")
+            emsg = err.get("message", "Unknown Error")
+            return f"{etype}: {emsg}", "", True
+        return json_codec.dumps(obj, ensure_ascii=False), "", True
+
+    def handle_event(self, state, event, payload, pieces):
+        data = payload if isinstance(payload, dict) else {}
+        if event == "message_start":
+            # input_tokens 不含读取或写入缓存的部分，这里换算为全部输入 token
+            usage = data.get("message", {}).get("usage") or {}
+            cached = usage.get("cache_read_input_tokens") or 0
+            written = usage.get("cache_creation_input_tokens") or 0
+            state["input_tokens"] = (usage.get("input_tokens") or 0) + cached + written
+            state["cached_tokens"] = cached
+            state["cache_write_tokens"] = written
+        elif event == "message_delta":
+            output_tokens = (data.get("usage") or {}).get("output_tokens")
+            if output_tokens is not None:
+                state["output_tokens"] = output_tokens
+        elif event == "content_block_start":
+            pieces.append(data.get("content_block", {}).get("text", ""))
+        elif event == "content_block_delta":
+            pieces.append(data.get("delta", {}).get("text", ""))
+        elif event == "message_stop":
+            state["stopped"] = True
+            return True
+        elif event == "error":
+            # 直接回显错误详情并终止
+            err_obj = data.get("error", {})
+            etype = err_obj.get("type", "Error")
+            emsg = err_obj.get("message", "Unknown Error")
+            pieces.clear()
+            state["failed"] = True
+            state["text"], state["error"], state["stopped"] = (
+                f"{etype}: {emsg}",
+                "",
+                True,
+            )
+            return True
+        return False
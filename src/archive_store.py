@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+"""
+归档对话的打包存储：把 archive/ 下大量的小 JSON 文件打包为少量压缩段文件（archive/*.chs）。
+
+段文件由逐个独立压缩的对话、JSON 索引与固定长度的结尾组成：
+    [对话 0][对话 1]...[索引][索引偏移 u64][索引长度 u32][魔数 CHSG]
+索引按列记录每个对话的原文件名、在段中的偏移、长度、压缩算法、原 mtime 与原大小，
+因此按名称读取一个对话只需读结尾、索引与对应的一段字节。压缩算法按 zstd、gzip、lzma 的顺序
+取第一个可用的（可用环境变量 archive_codec 指定），每个对话单独记录算法，不同算法的段可以混用。
+
+打包后对话的路径保持不变（archive/<原文件名>），read_chat、历史列表与全文检索按同一路径访问，
+索引中的 mtime/size 也沿用原文件的值，已有的 archive_index.json 与 search.db 无需重建。
+同名的散文件优先于段中的副本（打包中途被打断时两者并存）。
+save_history.py 在散文件达到 PACK_AFTER 个时自动打包。
+
+    python3 archive_store.py pack <data_dir>     # 迁移：把全部散文件打包
+    python3 archive_store.py unpack <data_dir>   # 还原为散文件
+"""
+
+import os
+import struct
+import sys
+from collections import namedtuple
+
+import json_codec
+from chat_store import encode_message, read_chat
+from helper import trash_chat
+
+MAGIC = b"CHSG"
+INDEX_VERSION = 1
+# 索引偏移、索引长度、魔数
+TRAILER = struct.Struct("<QI4s")
+SEGMENT_SUFFIX = ".chs"
+CODECS = ("zstd", "gzip", "lzma")
+# 索引的各列
+COLUMNS = ("names", "offsets", "lengths", "codecs", "mtimes", "sizes")
+# 每个段最多容纳的对话数；删除或取出对话时需要重写所在的段，段不宜过大
+SEGMENT_CHATS = 1000
+PACK_AFTER = 200
+
+# 与 os.stat_result 中 chat_files 的调用方用到的字段一致
+PackedStat = namedtuple("PackedStat", "st_mtime st_size")
+
+index_cache = {}
+
+
+def make_codec(name):
+    """返回 (compress, decompress)；算法不可用时抛出 ImportError"""
+    if name == "zstd":
+        try:
+            from compression import zstd
+
+            return lambda data: zstd.compress(data, level=10), zstd.decompress
+        except ImportError:
+            import zstandard
+
+            return (
+                zstandard.ZstdCompressor(level=10).compress,
+                zstandard.ZstdDecompressor().decompress,
+            )
+
+    if name == "lzma":
+        import lzma
+
+        return lzma.compress, lzma.decompress
+
+    if name == "gzip":
+        import gzip
+
+        return lambda data: gzip.compress(data, mtime=0), gzip.decompress
+
+    raise ImportError(f"Unknown archive codec: {name}")
+
+
+def select_codec():
+    """返回 (name, compress)，按 archive_codec、CODECS 的顺序取第一个可用的算法"""
+    preferred = os.environ.get("archive_codec")
+    for name in (preferred,) + CODECS if preferred else CODECS:
+        try:
+            return name, make_codec(name)[0]
+        except ImportError:
+            continue
+    raise ImportError("No archive codec available")
+
+
+def segment_paths(archive_dir):
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(
+        entry.path
+        for entry in os.scandir(archive_dir)
+        if entry.is_file() and entry.name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def loose_paths(archive_dir):
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(
+        entry.path
+        for entry in os.scandir(archive_dir)
+        if entry.is_file()
+        and entry.name.endswith(".json")
+        and not entry.name.startswith(".")
+    )
+
+
+def read_index(segment):
+    """
+    返回段的索引：按列保存的 names/offsets/lengths/codecs/mtimes/sizes（按列比逐条的对象解析更快）；
+    不是有效的段文件时返回 None。同一进程内按段的 mtime/size 缓存。
+    """
+    try:
+        stat = os.stat(segment)
+        cached = index_cache.get(segment)
+        if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        with open(segment, "rb") as file:
+            if stat.st_size < TRAILER.size:
+                return None
+            file.seek(stat.st_size - TRAILER.size)
+            offset, length, magic = TRAILER.unpack(file.read(TRAILER.size))
+            if magic != MAGIC or offset + length + TRAILER.size != stat.st_size:
+                return None
+            file.seek(offset)
+            index = json_codec.loads(file.read(length))
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION:
+        return None
+    index_cache[segment] = ((stat.st_mtime_ns, stat.st_size), index)
+    return index
+
+
+def packed_chats(archive_dir):
+    """返回 [(path, PackedStat)]，path 为对话打包前的路径"""
+    prefix = os.path.join(archive_dir, "")
+    chats = []
+    for segment in segment_paths(archive_dir):
+        index = read_index(segment)
+        if index is not None:
+            chats += [
+                (prefix + name, PackedStat(mtime, size))
+                for name, mtime, size in zip(
+                    index["names"], index["mtimes"], index["sizes"]
+                )
+            ]
+    return chats
+
+
+def locate(path):
+    """返回 (段文件, 索引, 序号)；path 不在任何段中时返回 None"""
+    name = os.path.basename(path)
+    for segment in segment_paths(os.path.dirname(path)):
+        index = read_index(segment)
+        if index is not None and name in index["names"]:
+            return segment, index, index["names"].index(name)
+    return None
+
+
+def read_member(file, index, position):
+    file.seek(index["offsets"][position])
+    return file.read(index["lengths"][position])
+
+
+def read_packed(path):
+    """返回打包对话的 JSON Lines 字节；不存在时返回 None"""
+    found = locate(path)
+    if found is None:
+        return None
+    segment, index, position = found
+    with open(segment, "rb") as file:
+        data = read_member(file, index, position)
+    return make_codec(index["codecs"][position])[1](data)
+
+
+def write_segment(segment, members):
+    """
+    members 为 [(名称, 压缩算法, 原 mtime, 原大小, 压缩后的字节)]。
+    先写临时文件并 fsync 再替换，读取端看到的要么是旧段，要么是完整的新段。
+    """
+    temp_path = f"{segment}.tmp"
+    index = {"version": INDEX_VERSION}
+    for column in COLUMNS:
+        index[column] = []
+    with open(temp_path, "wb") as file:
+        for name, codec, mtime, size, data in members:
+            for column, value in zip(
+                COLUMNS, (name, file.tell(), len(data), codec, mtime, size)
+            ):
+                index[column].append(value)
+            file.write(data)
+        offset = file.tell()
+        raw_index = json_codec.dumps(index, ensure_ascii=False).encode("utf-8")
+        file.write(raw_index + TRAILER.pack(offset, len(raw_index), MAGIC))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, segment)
+
+
+def new_segment_path(archive_dir):
+    existing = segment_paths(archive_dir)
+    number = 1
+    if existing:
+        number = int(os.path.basename(existing[-1])[len("segment-") : -4]) + 1
+    return os.path.join(archive_dir, f"segment-{number:05d}{SEGMENT_SUFFIX}")
+
+
+def pack(archive_dir, paths=None):
+    """把散文件（默认全部）打包为新的段；段写入完成后才删除散文件。返回打包的对话数"""
+    paths = loose_paths(archive_dir) if paths is None else paths
+    if not paths:
+        return 0
+    codec, compress = select_codec()
+    for start in range(0, len(paths), SEGMENT_CHATS):
+        batch = paths[start : start + SEGMENT_CHATS]
+        members = []
+        for path in batch:
+            stat = os.stat(path)
+            # 经 read_chat 读取，旧格式与残缺行在打包时一并整理
+            raw = b"".join(encode_message(message) for message in read_chat(path))
+            members.append(
+                (
+                    os.path.basename(path),
+                    codec,
+                    stat.st_mtime,
+                    stat.st_size,
+                    compress(raw),
+                )
+            )
+        write_segment(new_segment_path(archive_dir), members)
+        for path in batch:
+            os.remove(path)
+    return len(paths)
+
+
+def remove_packed(path):
+    """从所在的段中删除对话，其余对话的压缩字节原样复制；返回是否找到"""
+    found = locate(path)
+    if found is None:
+        return False
+    segment, index, position = found
+    if len(index["names"]) == 1:
+        os.remove(segment)
+        return True
+    with open(segment, "rb") as file:
+        members = [
+            (
+                index["names"][other],
+                index["codecs"][other],
+                index["mtimes"][other],
+                index["sizes"][other],
+                read_member(file, index, other),
+            )
+            for other in range(len(index["names"]))
+            if other != position
+        ]
+    write_segment(segment, members)
+    return True
+
+
+def unpack(archive_dir):
+    """把全部段还原为散文件（保留原 mtime）；返回还原的对话数"""
+    count = 0
+    for segment in segment_paths(archive_dir):
+        index = read_index(segment)
+        if index is None:
+            continue
+        with open(segment, "rb") as file:
+            for position, name in enumerate(index["names"]):
+                path = os.path.join(archive_dir, name)
+                if not os.path.exists(path):
+                    decompress = make_codec(index["codecs"][position])[1]
+                    with open(path, "wb") as out:
+                        out.write(decompress(read_member(file, index, position)))
+                    mtime = index["mtimes"][position]
+                    os.utime(path, (mtime, mtime))
+                count += 1
+        os.remove(segment)
+    return count
+
+
+def discard_chat(path):
+    """
+    删除无效的归档对话并移到废纸篓。打包的对话先写回为散文件再移过去，
+    与散文件一样可以恢复；之后再从段中删除。
+    """
+    if not os.path.exists(path):
+        data = read_packed(path)
+        if data is None:
+            return
+        with open(path, "wb") as file:
+            file.write(data)
+    trash_chat(path)
+    remove_packed(path)
+
+
+def restore_chat(path, target_path):
+    """把归档对话移动到 target_path（恢复为当前对话）"""
+    if os.path.exists(path):
+        os.replace(path, target_path)
+    else:
+        data = read_packed(path)
+        if data is None:
+            raise FileNotFoundError(path)
+        with open(target_path, "wb") as file:
+            file.write(data)
+    remove_packed(path)
+
+
+def pack_if_needed(archive_dir):
+    """散文件达到 PACK_AFTER 个时全部打包"""
+    paths = loose_paths(archive_dir)
+    if len(paths) >= PACK_AFTER:
+        pack(archive_dir, paths)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "pack":
+        print(f"Packed {pack(os.path.join(sys.argv[2], 'archive'))} chats")
+    elif len(sys.argv) == 3 and sys.argv[1] == "unpack":
+        print(f"Unpacked {unpack(os.path.join(sys.argv[2], 'archive'))} chats")
@@ -1,16 +1,11 @@
 #!/usr/bin/env python3
 
-import json
 import sys
 
-from anthropic import AnthropicService
-from chatglm import ChatGLMService
-from deepseek import DeepseekService
-from gemini import GeminiService
-from helper import append_chat, env_var, file_exists, markdown_chat, read_chat
-from ollama import OllamaService
-from openai import OpenaiService
-from qwen import QwenService
+import json_codec
+from helper import env_var, file_exists
+from providers import load_service
+from rerun_schedule import rerun_bounds
 
 
 def run(argv):
@@ -21,125 +16,147 @@ def run(argv):
     chat_file = f"{env_var('alfred_workflow_data')}/chat.json"
     pid_stream_file = f"{env_var('alfred_workflow_cache')}/pid.txt"
     stream_file = f"{env_var('alfred_workflow_cache')}/stream.txt"
+    stream_state_file = f"{env_var('alfred_workflow_cache')}/stream_state.json"
+    cache_dir = env_var("alfred_workflow_cache")
     http_proxy = env_var("http_proxy")
     socks5_proxy = env_var("socks5_proxy")
     streaming_now = env_var("streaming_now") == "1"
     stream_marker = env_var("stream_marker") == "1"
 
     selected_llm_service = env_var("selected_llm_service")
+    llm_service = load_service(selected_llm_service, http_proxy, socks5_proxy)
 
-    openai_api_endpoint = env_var("openai_api_endpoint")
-    openai_api_key = env_var("openai_api_key")
-    openai_model = env_var("openai_model")
-
-    anthropic_api_endpoint = env_var("anthropic_api_endpoint")
-    anthropic_api_key = env_var("anthropic_api_key")
-    anthropic_model = env_var("anthropic_model")
-
-    gemini_api_endpoint = env_var("gemini_api_endpoint")
-    gemini_api_key = env_var("gemini_api_key")
-    gemini_model = env_var("gemini_model")
-
-    qwen_api_endpoint = env_var("qwen_api_endpoint")
-    qwen_api_key = env_var("qwen_api_key")
-    qwen_model = env_var("qwen_model")
-
-    ollama_api_endpoint = env_var("ollama_api_endpoint")
-    ollama_model = env_var("ollama_model")
-
-    deepseek_api_endpoint = env_var("deepseek_api_endpoint")
-    deepseek_api_key = env_var("deepseek_api_key")
-    deepseek_model = env_var("deepseek_model")
+    assert llm_service is not None, "LLM service is not selected properly."
 
-    chatglm_api_endpoint = env_var("chatglm_api_endpoint")
-    chatglm_api_key = env_var("chatglm_api_key")
-    chatglm_model = env_var("chatglm_model")
+    # 配置了多个服务商时并行提问，各自的回答分段展示；否则可选地与备选服务商竞速。
+    # 每个 rerun 都会执行到这里，只在配置了相应变量时才导入这两个模块
+    fanout_keys, race_keys = [], []
+    if env_var("fanout_services"):
+        from fanout import fanout_services
 
-    llm_service = None
-    if selected_llm_service == "openai":
-        llm_service = OpenaiService(
-            openai_api_endpoint, openai_api_key, openai_model, http_proxy, socks5_proxy
-        )
-    elif selected_llm_service == "anthropic":
-        llm_service = AnthropicService(
-            anthropic_api_endpoint,
-            anthropic_api_key,
-            anthropic_model,
-            http_proxy,
-            socks5_proxy,
-        )
-    elif selected_llm_service == "gemini":
-        llm_service = GeminiService(
-            gemini_api_endpoint, gemini_api_key, gemini_model, http_proxy, socks5_proxy
-        )
-    elif selected_llm_service == "qwen":
-        llm_service = QwenService(
-            qwen_api_endpoint, qwen_api_key, qwen_model, http_proxy, socks5_proxy
-        )
-    elif selected_llm_service == "ollama":
-        llm_service = OllamaService(
-            ollama_api_endpoint, ollama_model, http_proxy, socks5_proxy
-        )
-    elif selected_llm_service == "deepseek":
-        llm_service = DeepseekService(
-            deepseek_api_endpoint,
-            deepseek_api_key,
-            deepseek_model,
-            http_proxy,
-            socks5_proxy,
-        )
-    elif selected_llm_service == "chatglm":
-        llm_service = ChatGLMService(
-            chatglm_api_endpoint,
-            chatglm_api_key,
-            chatglm_model,
-            http_proxy,
-            socks5_proxy,
-        )
+        fanout_keys = fanout_services()
+    if not fanout_keys and env_var("race_fallbacks"):
+        from race import race_services
 
-    assert llm_service is not None, "LLM service is not selected properly."
+        race_keys = race_services(selected_llm_service)
 
     if streaming_now:
+        if fanout_keys or race_keys:
+            if fanout_keys:
+                from fanout import read_fanout as read_services
+            else:
+                from race import read_race as read_services
+            return read_services(
+                cache_dir,
+                chat_file,
+                stream_file,
+                pid_stream_file,
+                stream_marker,
+                http_proxy,
+                socks5_proxy,
+            )
         return llm_service.read_stream(
-            stream_file, chat_file, pid_stream_file, stream_marker
+            stream_file, chat_file, pid_stream_file, stream_state_file, stream_marker
         )
 
-    previous_chat = read_chat(chat_file)
+    from chat_render import render_chat
 
     if file_exists(stream_file):
-        return json.dumps(
+        return json_codec.dumps(
             {
-                "rerun": 0.1,
+                "rerun": rerun_bounds()[0],
                 "variables": {"streaming_now": True, "stream_marker": True},
-                "response": markdown_chat(previous_chat, True),
+                "response": render_chat(chat_file, cache_dir, True),
                 "behaviour": {"scroll": "end"},
-            }
+            },
+            ensure_ascii=False,
         )
 
     if not typed_query:
-        return json.dumps(
+        return json_codec.dumps(
             {
-                "response": markdown_chat(previous_chat, False),
+                "response": render_chat(chat_file, cache_dir, False),
                 "behaviour": {"scroll": "end"},
-            }
+            },
+            ensure_ascii=False,
         )
 
+    from chat_store import append_chat
+    from context_summary import request_summary, summary_service, with_summary
+    from context_window import (
+        TokenCounter,
+        build_context,
+        recent_messages,
+        selected_label,
+        token_budget,
+    )
+
     append_query = {"role": "user", "content": typed_query}
-    ongoing_chat = previous_chat + [append_query]
-    context_chat = ongoing_chat[-max_context:]
+    summarize_context = bool(summary_service())
+    if summarize_context:
+        # 被挤出上下文的旧消息以摘要的形式随系统提示词发送，并计入 token 预算
+        system_prompt = with_summary(system_prompt, chat_file)
+    context_budget = token_budget(selected_llm_service)
+    if context_budget:
+        counter = TokenCounter(
+            env_var("alfred_workflow_cache"), env_var("context_tokenizer")
+        )
+        context_chat = build_context(
+            chat_file,
+            append_query,
+            system_prompt,
+            context_budget,
+            counter,
+            selected_label(),
+        )
+    else:
+        # 上下文只取末尾若干条，直接从文件尾部读取，与对话总长度无关
+        history = recent_messages(chat_file, max_context - 1, selected_label())
+        context_chat = history + [append_query]
 
-    llm_service.start_stream(
-        max_tokens, system_prompt, context_chat, stream_file, pid_stream_file
-    )
+    if summarize_context:
+        request_summary(chat_file, len(context_chat) - 1)
+
+    # 对话中的消息可能带有 provider 等仅用于展示的字段，发送前去掉
+    context_chat = [
+        {"role": message["role"], "content": message["content"]}
+        for message in context_chat
+    ]
+
+    if fanout_keys or race_keys:
+        from fanout import start_fanout
+
+        start_fanout(
+            fanout_keys or race_keys,
+            http_proxy,
+            socks5_proxy,
+            max_tokens,
+            system_prompt,
+            context_chat,
+            stream_file,
+            pid_stream_file,
+            cache_dir,
+        )
+    else:
+        llm_service.start_stream(
+            max_tokens,
+            system_prompt,
+            context_chat,
+            stream_file,
+            pid_stream_file,
+            stream_state_file,
+        )
 
     append_chat(chat_file, append_query)
 
-    return json.dumps(
+    # 只渲染缓存之后新增的消息，旧消息的 Markdown 直接复用
+    return json_codec.dumps(
         {
-            "rerun": 0.1,
+            "rerun": rerun_bounds()[0],
             "variables": {"streaming_now": True, "stream_marker": True},
-            "response": markdown_chat(ongoing_chat),
-        }
+            "response": render_chat(chat_file, cache_dir),
+        },
+        ensure_ascii=False,
     )
 
 
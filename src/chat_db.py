@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+"""
+可选的 SQLite 对话存储（chat_backend=sqlite）：全部对话保存在 alfred_workflow_data/chats.db 中。
+
+WAL 模式下读取端总是看到某次提交后的完整快照，rerun 与 append_chat 并发时不会读到写了一半的对话；
+写入之间由 SQLite 的锁串行化（busy_timeout 内等待）。消息按 (conversation_id, seq) 建唯一索引，
+读取最后若干条消息、按角色查找最后一条消息都与对话长度无关。
+
+对话仍以原来的路径命名（chat.json、archive/<原文件名>，相对 alfred_workflow_data），
+chat_store 的各函数按同一路径转发到这里，调用方无需区分两种存储。
+SQL 语句都是带参数的固定文本，由 sqlite3 模块按连接缓存预编译的语句。
+
+    python3 chat_db.py import <data_dir>   # 导入现有的 chat.json 与归档（含打包的段文件），原文件保留
+    python3 chat_db.py export <data_dir>   # 导出回 JSON Lines 文件，便于切换回文件存储
+"""
+
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+import json_codec
+from helper import env_var
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE,
+    created REAL, updated REAL, version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL, role TEXT, content TEXT, extra TEXT, created REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_conversation
+    ON messages (conversation_id, seq);
+CREATE INDEX IF NOT EXISTS messages_created ON messages (created);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated);
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+SELECT_CONVERSATION = "SELECT id, version FROM conversations WHERE name = ?"
+SELECT_MESSAGES = (
+    "SELECT seq, role, content, extra FROM messages "
+    "WHERE conversation_id = (SELECT id FROM conversations WHERE name = ?) "
+    "AND seq >= ? ORDER BY seq"
+)
+SELECT_MESSAGES_REVERSE = (
+    "SELECT seq, role, content, extra FROM messages "
+    "WHERE conversation_id = (SELECT id FROM conversations WHERE name = ?) "
+    "ORDER BY seq DESC"
+)
+SELECT_LAST_MESSAGES = SELECT_MESSAGES_REVERSE + " LIMIT ?"
+SELECT_LAST_BY_ROLE = (
+    "SELECT seq, role, content, extra FROM messages "
+    "WHERE conversation_id = (SELECT id FROM conversations WHERE name = ?) "
+    "AND role = ? ORDER BY seq DESC LIMIT 1"
+)
+# seq 从 0 开始连续编号，最大序号加一即消息数，可直接由索引得到
+COUNT_MESSAGES = (
+    "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages "
+    "WHERE conversation_id = (SELECT id FROM conversations WHERE name = ?)"
+)
+UPSERT_CONVERSATION = (
+    "INSERT INTO conversations (name, created, updated) VALUES (?, ?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET updated = excluded.updated"
+)
+# 序号在同一条语句中计算，并发追加时不会取到相同的 seq
+INSERT_MESSAGE = (
+    "INSERT INTO messages (conversation_id, seq, role, content, extra, created) "
+    "SELECT id, (SELECT COALESCE(MAX(seq) + 1, 0) FROM messages "
+    "WHERE conversation_id = conversations.id), ?, ?, ?, ? "
+    "FROM conversations WHERE name = ?"
+)
+INSERT_MESSAGE_AT = (
+    "INSERT INTO messages (conversation_id, seq, role, content, extra, created) "
+    "SELECT id, ?, ?, ?, ?, ? FROM conversations WHERE name = ?"
+)
+DELETE_MESSAGES = (
+    "DELETE FROM messages "
+    "WHERE conversation_id = (SELECT id FROM conversations WHERE name = ?)"
+)
+BUMP_VERSION = "UPDATE conversations SET version = version + 1 WHERE name = ?"
+DELETE_CONVERSATION = "DELETE FROM conversations WHERE name = ?"
+RENAME_CONVERSATION = (
+    "UPDATE conversations SET name = ?, version = version + 1 WHERE name = ?"
+)
+LIST_CONVERSATIONS = "SELECT name, updated, version FROM conversations"
+STAT_CONVERSATION = "SELECT updated, version FROM conversations WHERE name = ?"
+
+# 与 os.stat_result 中 chat_files 的调用方用到的字段一致：mtime 为最后更新时间，
+# size 为改写版本号，二者不变即对话内容不变
+ChatStat = namedtuple("ChatStat", "st_mtime st_size")
+
+connections = {}
+
+
+def db_path(data_dir):
+    return os.path.join(data_dir, "chats.db")
+
+
+def connect(data_dir):
+    conn = connections.get(data_dir)
+    if conn is None:
+        conn = sqlite3.connect(db_path(data_dir), timeout=5, cached_statements=64)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(SCHEMA)
+        connections[data_dir] = conn
+    return conn
+
+
+def locate(path):
+    """返回 (连接, 对话名)；对话名为相对 alfred_workflow_data 的路径"""
+    data_dir = env_var("alfred_workflow_data") or os.path.dirname(path)
+    return connect(data_dir), os.path.relpath(path, data_dir)
+
+
+def split_message(message):
+    extra = {k: v for k, v in message.items() if k not in ("role", "content")}
+    return (
+        message.get("role"),
+        message.get("content"),
+        json_codec.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+
+
+def join_message(row):
+    _, role, content, extra = row
+    message = {"role": role, "content": content}
+    if extra:
+        message.update(json_codec.loads(extra))
+    return message
+
+
+def read_chat(path):
+    conn, name = locate(path)
+    return [join_message(row) for row in conn.execute(SELECT_MESSAGES, (name, 0))]
+
+
+def read_from(path, seq):
+    """返回 [(seq, 消息)]，只包含 seq 及之后的消息"""
+    conn, name = locate(path)
+    rows = conn.execute(SELECT_MESSAGES, (name, seq))
+    return [(row[0], join_message(row)) for row in rows]
+
+
+def iter_reverse(path):
+    conn, name = locate(path)
+    for row in conn.execute(SELECT_MESSAGES_REVERSE, (name,)):
+        yield join_message(row)
+
+
+def read_last(path, n):
+    if n <= 0:
+        return []
+    conn, name = locate(path)
+    rows = conn.execute(SELECT_LAST_MESSAGES, (name, n)).fetchall()
+    return [join_message(row) for row in reversed(rows)]
+
+
+def last_by_role(path, role):
+    conn, name = locate(path)
+    row = conn.execute(SELECT_LAST_BY_ROLE, (name, role)).fetchone()
+    return join_message(row) if row else None
+
+
+def message_count(path):
+    conn, name = locate(path)
+    return conn.execute(COUNT_MESSAGES, (name,)).fetchone()[0]
+
+
+def revision(path):
+    """返回 (对话 id, 版本)；对话被改写或改名时版本递增，只追加时不变。不存在时返回 None"""
+    conn, name = locate(path)
+    return conn.execute(SELECT_CONVERSATION, (name,)).fetchone()
+
+
+def append_chat(path, message):
+    conn, name = locate(path)
+    now = time.time()
+    with conn:
+        conn.execute(UPSERT_CONVERSATION, (name, now, now))
+        conn.execute(INSERT_MESSAGE, split_message(message) + (now, name))
+
+
+def write_chat(path, messages, updated=None):
+    """在一个事务中替换对话的全部消息"""
+    conn, name = locate(path)
+    now = time.time()
+    with conn:
+        conn.execute(UPSERT_CONVERSATION, (name, now, updated or now))
+        conn.execute(DELETE_MESSAGES, (name,))
+        conn.execute(BUMP_VERSION, (name,))
+        conn.executemany(
+            INSERT_MESSAGE_AT,
+            [
+                (seq,) + split_message(message) + (None, name)
+                for seq, message in enumerate(messages)
+            ],
+        )
+
+
+def rename(old_path, new_path):
+    """覆盖 new_path 处已有的对话；old_path 不存在时抛出 FileNotFoundError"""
+    conn, old_name = locate(old_path)
+    new_name = locate(new_path)[1]
+    with conn:
+        if conn.execute(SELECT_CONVERSATION, (old_name,)).fetchone() is None:
+            raise FileNotFoundError(old_path)
+        conn.execute(DELETE_CONVERSATION, (new_name,))
+        conn.execute(RENAME_CONVERSATION, (new_name, old_name))
+
+
+def remove(path):
+    conn, name = locate(path)
+    with conn:
+        conn.execute(DELETE_CONVERSATION, (name,))
+
+
+def discard(path):
+    """
+    与文件存储一致，删除的对话可以从废纸篓恢复：先导出为原路径处的 JSON Lines 文件
+    （保留更新时间）并移到废纸篓，再从数据库中删除
+    """
+    from chat_store import encode_message
+    from helper import trash_chat
+
+    conn, name = locate(path)
+    row = conn.execute(STAT_CONVERSATION, (name,)).fetchone()
+    if row is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(b"".join(encode_message(m) for m in read_chat(path)))
+    if row[0]:
+        os.utime(path, (row[0], row[0]))
+    trash_chat(path)
+    remove(path)
+
+
+def stat(path):
+    conn, name = locate(path)
+    row = conn.execute(STAT_CONVERSATION, (name,)).fetchone()
+    if row is None:
+        raise FileNotFoundError(path)
+    return ChatStat(*row)
+
+
+def chat_files(data_dir):
+    """与 history_index.chat_files 相同：归档按名称排序，当前对话 chat.json 排在最后"""
+    rows = connect(data_dir).execute(LIST_CONVERSATIONS).fetchall()
+    files = sorted(
+        (os.path.join(data_dir, name), ChatStat(updated, version))
+        for name, updated, version in rows
+        if name.startswith("archive" + os.sep)
+    )
+    for name, updated, version in rows:
+        if name == "chat.json":
+            files.append((os.path.join(data_dir, name), ChatStat(updated, version)))
+    return files
+
+
+def import_files(data_dir):
+    """导入 chat.json 与全部归档（散文件与段文件）；已存在的同名对话会被覆盖。返回导入的对话数"""
+    from archive_store import loose_paths, packed_chats
+    from chat_store import read_chat_file
+
+    archive_dir = os.path.join(data_dir, "archive")
+    paths = [(path, os.stat(path)) for path in loose_paths(archive_dir)]
+    loose = {path for path, _ in paths}
+    paths += [item for item in packed_chats(archive_dir) if item[0] not in loose]
+    current_chat = os.path.join(data_dir, "chat.json")
+    if os.path.exists(current_chat):
+        paths.append((current_chat, os.stat(current_chat)))
+
+    conn = connect(data_dir)
+    for path, file_stat in paths:
+        write_chat(path, read_chat_file(path), updated=file_stat.st_mtime)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO metadata VALUES ('imported', ?)",
+            (str(time.time()),),
+        )
+    return len(paths)
+
+
+def export_files(data_dir):
+    """把全部对话写回 JSON Lines 文件（保留更新时间）；返回导出的对话数"""
+    from chat_store import encode_message
+
+    rows = connect(data_dir).execute(LIST_CONVERSATIONS).fetchall()
+    for name, updated, _ in rows:
+        path = os.path.join(data_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"".join(encode_message(m) for m in read_chat(path)))
+        if updated:
+            os.utime(path, (updated, updated))
+    return len(rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "import":
+        os.environ["alfred_workflow_data"] = sys.argv[2]
+        print(f"Imported {import_files(sys.argv[2])} chats")
+    elif len(sys.argv) == 3 and sys.argv[1] == "export":
+        os.environ["alfred_workflow_data"] = sys.argv[2]
+        print(f"Exported {export_files(sys.argv[2])} chats")
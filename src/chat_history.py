@@ -1,16 +1,11 @@
 #!/usr/bin/env python3
 
-import json
 import os
 
-from helper import (
-    dir_contents,
-    env_var,
-    file_exists,
-    no_archives,
-    read_chat,
-    trash_chat,
-)
+import json_codec
+from chat_store import delete_chat, use_database
+from helper import env_var, no_archives
+from history_index import refresh_index, remove_entry
 
 
 def _truncate(text, limit):
@@ -21,58 +16,42 @@ def _truncate(text, limit):
 
 
 def run():
-    archive_dir = os.path.join(env_var("alfred_workflow_data"), "archive")
-    if not os.path.exists(archive_dir):
+    data_dir = env_var("alfred_workflow_data")
+    archive_dir = os.path.join(data_dir, "archive")
+    if not use_database() and not os.path.exists(archive_dir):
         return no_archives()
 
     items = []
-    chat_files = dir_contents(archive_dir)
+    for file, entry in reversed(refresh_index(data_dir)):
+        first_question = entry["first"]
+        last_question = entry["last"]
 
-    ongoing_chat_file = os.path.join(env_var("alfred_workflow_data"), "chat.json")
-    if file_exists(ongoing_chat_file):
-        chat_files.append(ongoing_chat_file)
+        # Delete invalid chats
+        if not first_question:
+            delete_chat(file)
+            remove_entry(data_dir, os.path.basename(file))
+            continue
 
-    for file in reversed(chat_files):
-        if file.endswith(".json"):
-            chat_contents = read_chat(file)
-            first_question = next(
-                (item["content"] for item in chat_contents if item["role"] == "user"),
-                None,
-            )
-            last_question = next(
-                (
-                    item["content"]
-                    for item in reversed(chat_contents)
-                    if item["role"] == "user"
-                ),
-                None,
-            )
-
-            # Delete invalid chats
-            if not first_question:
-                trash_chat(file)
-                continue
-
-            uid = os.path.basename(file)
-            title = _truncate(first_question, 80)
-            subtitle = _truncate(last_question or "", 120)
-            items.append(
-                {
-                    "uid": uid,
-                    "title": title,
-                    "subtitle": subtitle,
-                    "match": f"{first_question} {last_question}",
-                    "arg": file,
-                    "valid": True,
-                    "text": {
-                        "copy": f"{first_question} — {last_question or ''}",
-                        "largetype": title,
-                    },
-                }
-            )
+        uid = os.path.basename(file)
+        title = _truncate(first_question, 80)
+        subtitle = _truncate(last_question or "", 120)
+        items.append(
+            {
+                "uid": uid,
+                "title": title,
+                "subtitle": subtitle,
+                "match": f"{first_question} {last_question}",
+                "arg": file,
+                "valid": True,
+                "text": {
+                    "copy": f"{first_question} — {last_question or ''}",
+                    "largetype": title,
+                },
+            }
+        )
 
     if not items:
-        return json.dumps(
+        return json_codec.dumps(
             {
                 "items": [
                     {
@@ -85,7 +64,7 @@ def run():
             }
         )
 
-    return json.dumps({"items": items})
+    return json_codec.dumps({"items": items})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+"""
+带缓存的对话渲染。
+
+对话文件只会追加，因此把“除最后一条以外”的消息渲染结果缓存在 render_cache.md 中，
+并在 render_cache.json 里记录其覆盖的字节长度与内容摘要。再次渲染时只要文件前缀未变，
+就只解析和渲染之后新增的消息；最后一条消息的渲染依赖后续消息，因此每次都重新渲染。
+SQLite 存储中 offset 为消息序号，摘要换成对话 id 与改写版本号。
+"""
+
+import hashlib
+import os
+
+import json_codec
+from chat_store import decode_line, use_database
+from helper import file_exists, make_dir, markdown_chat, markdown_message, write_file
+
+
+def load_cache(cache_dir):
+    meta_file = os.path.join(cache_dir, "render_cache.json")
+    text_file = os.path.join(cache_dir, "render_cache.md")
+    if not (file_exists(meta_file) and file_exists(text_file)):
+        return None, ""
+    with open(meta_file, "r", encoding="utf-8") as file:
+        meta = json_codec.loads(file.read())
+    with open(text_file, "r", encoding="utf-8") as file:
+        return meta, file.read()
+
+
+def save_cache(cache_dir, offset, digest, prefix):
+    make_dir(cache_dir)
+    write_file(os.path.join(cache_dir, "render_cache.md"), prefix)
+    write_file(
+        os.path.join(cache_dir, "render_cache.json"),
+        json_codec.dumps({"offset": offset, "digest": digest}),
+    )
+
+
+def decode_from(raw, offset):
+    """返回 offset 之后的 [(行起始字节偏移, 消息)]，跳过空行与残缺行"""
+    messages = []
+    position = offset
+    for line in raw[offset:].split(b"\n"):
+        message = decode_line(line)
+        if message is not None:
+            messages.append((position, message))
+        position += len(line) + 1
+    return messages
+
+
+def render_tail(cache_dir, tail, offset, prefix, digest, ignore_last_interrupted):
+    """tail 为 [(offset, 消息)]；digest(last_offset) 返回写回缓存时记录的摘要"""
+    if not tail:
+        return prefix
+
+    pieces = [prefix]
+    for index in range(len(tail) - 1):
+        pieces.append(markdown_message(tail[index][1], tail[index + 1][1]))
+    settled = "".join(pieces)
+
+    # 最后一条消息之前的部分已不会再变化，写回缓存
+    last_offset = tail[-1][0]
+    if last_offset != offset:
+        save_cache(cache_dir, last_offset, digest(last_offset), settled)
+
+    return settled + markdown_message(tail[-1][1], None, ignore_last_interrupted)
+
+
+def render_database(chat_file, cache_dir, ignore_last_interrupted):
+    import chat_db
+
+    found = chat_db.revision(chat_file)
+    if found is None:
+        return ""
+    digest = "db:{}:{}".format(*found)
+
+    meta, prefix = load_cache(cache_dir)
+    offset = 0
+    if meta and meta["digest"] == digest:
+        offset = meta["offset"]
+    if offset == 0:
+        prefix = ""
+
+    tail = chat_db.read_from(chat_file, offset)
+    return render_tail(
+        cache_dir, tail, offset, prefix, lambda _: digest, ignore_last_interrupted
+    )
+
+
+def render_chat(chat_file, cache_dir, ignore_last_interrupted=True):
+    if use_database():
+        return render_database(chat_file, cache_dir, ignore_last_interrupted)
+    if not file_exists(chat_file):
+        return ""
+    with open(chat_file, "rb") as file:
+        raw = file.read()
+    if raw.lstrip().startswith(b"["):
+        # 旧格式无法按字节前缀复用，直接整体渲染
+        return markdown_chat(json_codec.loads(raw), ignore_last_interrupted)
+
+    meta, prefix = load_cache(cache_dir)
+    offset = 0
+    if meta and meta["offset"] <= len(raw):
+        digest = hashlib.sha1(raw[: meta["offset"]]).hexdigest()
+        if digest == meta["digest"]:
+            offset = meta["offset"]
+    if offset == 0:
+        prefix = ""
+
+    tail = decode_from(raw, offset)
+    return render_tail(
+        cache_dir,
+        tail,
+        offset,
+        prefix,
+        lambda last_offset: hashlib.sha1(raw[:last_offset]).hexdigest(),
+        ignore_last_interrupted,
+    )
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import sys
+
+import json_codec
+from helper import env_var
+from history_index import load_index
+from search_index import search, sync
+
+
+def message_item(title, subtitle):
+    return json_codec.dumps({"items": [{"title": title, "subtitle": subtitle, "valid": False}]})
+
+
+def run(argv):
+    query = argv[0].strip() if argv else ""
+    data_dir = env_var("alfred_workflow_data")
+    if not query:
+        return message_item("Search Chat History", "Type to search every message")
+
+    try:
+        conn = sync(data_dir)
+        rows = search(conn, query)
+    except sqlite3.Error as e:
+        return message_item("Full-text search unavailable", str(e))
+
+    entries = load_index(data_dir)
+    items = []
+    for name, seq, role, snippet in rows:
+        path = os.path.join(data_dir, name)
+        first_question = entries.get(os.path.basename(name), {}).get("first", "")
+        label = "Current chat" if name == "chat.json" else first_question
+        items.append(
+            {
+                "uid": f"{name}#{seq}",
+                "title": " ".join(snippet.split()),
+                "subtitle": f"{role} · {label}",
+                "arg": path,
+                "valid": True,
+                "text": {"copy": snippet, "largetype": snippet},
+            }
+        )
+
+    if not items:
+        return message_item("No Matches", f"Nothing found for “{query}”")
+    return json_codec.dumps({"items": items})
+
+
+if __name__ == "__main__":
+    print(run(sys.argv[1:]))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""
+对话存储：每条消息一行 JSON（JSON Lines），追加写入而不是整体重写。
+
+旧版本把整个对话保存为一个 JSON 数组（以 [ 开头），读取时自动识别；
+首次向旧格式文件追加消息时会原子地转换为新格式。文件名保持不变（chat.json / archive/*.json）。
+归档对话可能已打包进段文件（见 archive_store.py），read_chat 按原路径透明读取。
+设置 chat_backend=sqlite 时，以下各函数按同一路径转发到 chat_db.py 中的 SQLite 存储。
+
+    python3 chat_store.py compact <file>...   # 把旧格式或含残缺行的文件整理为新格式
+"""
+
+import os
+import sys
+from itertools import islice
+
+import json_codec
+
+BLOCK_SIZE = 65536
+
+
+def use_database():
+    # 只在启用时才导入 chat_db，文件存储不必加载 sqlite3
+    return os.environ.get("chat_backend") == "sqlite"
+
+
+def is_legacy(path):
+    with open(path, "rb") as file:
+        return file.read(64).lstrip().startswith(b"[")
+
+
+def decode_line(line):
+    if not line.strip():
+        return None
+    try:
+        return json_codec.loads(line)
+    except ValueError:
+        # 写入中途被打断留下的残缺行
+        return None
+
+
+def decode_lines(raw):
+    messages = []
+    for line in raw.splitlines():
+        message = decode_line(line)
+        if message is not None:
+            messages.append(message)
+    return messages
+
+
+def read_chat(path):
+    if use_database():
+        import chat_db
+
+        return chat_db.read_chat(path)
+    return read_chat_file(path)
+
+
+def read_chat_file(path):
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            raw = file.read()
+    else:
+        # 已打包进段文件的归档对话仍按原路径访问
+        from archive_store import read_packed
+
+        raw = read_packed(path)
+        if raw is None:
+            return []
+    if raw.lstrip().startswith(b"["):
+        return json_codec.loads(raw)
+    return decode_lines(raw)
+
+
+def iter_reverse(path):
+    """从文件末尾按块向前读取，由新到旧逐条解码消息；调用方取够即可停止"""
+    if use_database():
+        import chat_db
+
+        yield from chat_db.iter_reverse(path)
+        return
+    if not os.path.exists(path) or is_legacy(path):
+        yield from reversed(read_chat(path))
+        return
+
+    with open(path, "rb") as file:
+        position = file.seek(0, os.SEEK_END)
+        pending = b""
+        while position > 0:
+            step = min(BLOCK_SIZE, position)
+            position -= step
+            file.seek(position)
+            lines = (file.read(step) + pending).split(b"\n")
+            # 第一段可能是被块边界截断的行，留到读取前一块时再拼接
+            pending = lines[0]
+            for line in reversed(lines[1:]):
+                message = decode_line(line)
+                if message is not None:
+                    yield message
+        message = decode_line(pending)
+        if message is not None:
+            yield message
+
+
+def read_last(path, n):
+    if n <= 0:
+        return []
+    if use_database():
+        import chat_db
+
+        return chat_db.read_last(path, n)
+    messages = list(islice(iter_reverse(path), n))
+    messages.reverse()
+    return messages
+
+
+def last_by_role(path, role):
+    if use_database():
+        import chat_db
+
+        return chat_db.last_by_role(path, role)
+    return next((m for m in iter_reverse(path) if m.get("role") == role), None)
+
+
+def encode_message(message):
+    return (json_codec.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def write_chat(path, messages):
+    """原子地重写整个对话（写临时文件、fsync 后 rename）"""
+    if use_database():
+        import chat_db
+
+        chat_db.write_chat(path, messages)
+        return
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(b"".join(encode_message(message) for message in messages))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def compact_chat(path):
+    if not use_database() and os.path.exists(path):
+        write_chat(path, read_chat(path))
+
+
+def reset_chat(path):
+    write_chat(path, [])
+
+
+def append_chat(path, message):
+    if use_database():
+        import chat_db
+
+        chat_db.append_chat(path, message)
+    else:
+        append_chat_file(path, message)
+
+    # 延迟导入：只有写入消息时才需要 sqlite3
+    import search_index
+
+    search_index.on_append(path, message)
+
+
+def stat_chat(path):
+    """返回对话的 mtime/size；SQLite 存储中为更新时间与改写版本号"""
+    if use_database():
+        import chat_db
+
+        return chat_db.stat(path)
+    return os.stat(path)
+
+
+def move_chat(path, target_path):
+    """移动对话（归档或恢复）；覆盖 target_path 处已有的对话"""
+    if use_database():
+        import chat_db
+
+        chat_db.rename(path, target_path)
+        return
+    from archive_store import restore_chat
+
+    restore_chat(path, target_path)
+
+
+def delete_chat(path):
+    """删除对话并移到废纸篓"""
+    if use_database():
+        import chat_db
+
+        chat_db.discard(path)
+        return
+    from archive_store import discard_chat
+
+    discard_chat(path)
+
+
+def append_chat_file(path, message):
+    if os.path.exists(path) and is_legacy(path):
+        compact_chat(path)
+
+    with open(path, "ab+") as file:
+        file.seek(0, os.SEEK_END)
+        prefix = b""
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            # 上一次写入若被截断，先补一个换行，让残缺内容独占一行而不是污染新消息
+            if file.read(1) != b"\n":
+                prefix = b"\n"
+        file.write(prefix + encode_message(message))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "compact":
+        for chat_path in sys.argv[2:]:
+            compact_chat(chat_path)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""
+上下文摘要：对话超出上下文窗口后，被挤出窗口的旧消息由后台进程交给模型压缩为一段摘要，
+保存在 chat.json 旁的 chat_summary.json 中，之后的提问把它附在系统提示词之后发送。
+
+摘要滚动更新：已有摘要覆盖对话的前 covers 条消息，新被挤出的消息与旧摘要一起交给模型生成新摘要；
+被挤出的范围没有变化时直接复用，不再请求模型。摘要中记录已覆盖消息的哈希，对话被改写后从头重新生成；
+归档或切换对话时（save_history.py）删除摘要。
+context_summary 设置为 selected 时使用当前服务商，也可以指定一个更便宜的服务商（例如本地的 Ollama）。
+
+    python3 context_summary.py <chat_file> <size> <kept>   # 后台进程，由 request_summary 启动
+"""
+
+import hashlib
+import os
+import sys
+import time
+from itertools import islice
+
+import json_codec
+from chat_store import decode_lines, iter_reverse, read_chat, use_database
+from context_window import collapse_answers, selected_label
+from helper import delete_file, env_var, file_exists, file_modified, write_file
+from providers import load_service
+
+SUMMARY_MAX_TOKENS = 1024
+# 单次请求中新增消息的字符上限；首次为长对话生成摘要时分批滚动完成
+BATCH_CHARS = 24000
+# 后台进程的锁超过这个时间视为已失效
+LOCK_TIMEOUT_SEC = 300
+
+SUMMARY_HEADER = "Summary of the earlier part of this conversation:"
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below so that it can replace the original messages "
+    "as context for continuing the chat. If it starts with a summary of even earlier "
+    "messages, merge that summary into yours. Keep facts, decisions, names, numbers, code "
+    "identifiers and open questions; drop greetings and repetition. Write in the "
+    "language of the conversation. Reply with the summary only."
+)
+
+
+def summary_service():
+    """返回用于生成摘要的服务商；未启用时返回空字符串"""
+    value = env_var("context_summary")
+    if value == "selected":
+        return env_var("selected_llm_service")
+    return value
+
+
+def summary_path(chat_file):
+    return os.path.join(os.path.dirname(chat_file), "chat_summary.json")
+
+
+def lock_path():
+    return os.path.join(env_var("alfred_workflow_cache"), "summary.lock")
+
+
+def read_summary(chat_file):
+    path = summary_path(chat_file)
+    if not file_exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json_codec.loads(file.read())
+    except ValueError:
+        return None
+
+
+def write_summary(chat_file, summary):
+    # 先写临时文件再替换，前台进程不会读到写了一半的摘要
+    temp_path = f"{summary_path(chat_file)}.tmp"
+    write_file(temp_path, json_codec.dumps(summary, ensure_ascii=False))
+    os.replace(temp_path, summary_path(chat_file))
+
+
+def with_summary(system_prompt, chat_file):
+    """把已有的摘要附在系统提示词之后"""
+    summary = read_summary(chat_file)
+    if not summary or not summary.get("text"):
+        return system_prompt
+    section = f"{SUMMARY_HEADER}\n{summary['text']}"
+    return f"{system_prompt}\n\n{section}" if system_prompt else section
+
+
+def has_evicted(chat_file, kept):
+    """对话中是否还有比上下文中最早的 kept 条更早的消息（与上下文一样合并并行模式的回答）"""
+    messages = collapse_answers(iter_reverse(chat_file), selected_label())
+    return next(islice(messages, kept, None), None) is not None
+
+
+def digest(messages):
+    hasher = hashlib.sha1()
+    for message in messages:
+        hasher.update(json_codec.dumps([message["role"], message["content"]]).encode())
+    return hasher.hexdigest()[:16]
+
+
+def request_summary(chat_file, kept):
+    """
+    上下文没有放下全部消息时，在后台更新摘要。kept 为本次上下文中的历史消息数（不含本次提问）；
+    同时记下对话文件当前的大小（SQLite 存储中为消息数），后台进程只看这之前的消息，
+    不受随后追加的提问与回答影响。
+    """
+    if not use_database() and not file_exists(chat_file):
+        return
+    if not has_evicted(chat_file, kept):
+        return
+    lock_file = lock_path()
+    if (
+        file_exists(lock_file)
+        and time.time() - file_modified(lock_file) < LOCK_TIMEOUT_SEC
+    ):
+        return
+    write_file(lock_file, "")
+
+    # 延迟导入：rerun 时不需要 subprocess
+    import subprocess
+
+    if use_database():
+        import chat_db
+
+        size = chat_db.message_count(chat_file)
+    else:
+        size = os.path.getsize(chat_file)
+    script = os.path.abspath(__file__)
+    with open(os.devnull, "w") as devnull:
+        subprocess.Popen(
+            [sys.executable, script, chat_file, str(size), str(kept)],
+            stdout=devnull,
+            stderr=devnull,
+            start_new_session=True,
+        )
+
+
+def transcript(messages):
+    return "\n\n".join(
+        f"{message['role'].capitalize()}: {message['content']}" for message in messages
+    )
+
+
+def batches(messages):
+    batch, chars = [], 0
+    for message in messages:
+        length = len(message.get("content") or "")
+        if batch and chars + length > BATCH_CHARS:
+            yield batch
+            batch, chars = [], 0
+        batch.append(message)
+        chars += length
+    if batch:
+        yield batch
+
+
+def ask_model(service, previous, messages, cache_dir):
+    """请求一次摘要；失败时返回 None"""
+    import subprocess
+
+    parts = [SUMMARY_PROMPT]
+    if previous:
+        parts.append(f"{SUMMARY_HEADER}\n{previous}")
+    parts.append(transcript(messages))
+    query = [{"role": "user", "content": "\n\n".join(parts)}]
+
+    stream_file = os.path.join(cache_dir, "summary_stream.txt")
+    curl_command = service.construct_curl_command(
+        SUMMARY_MAX_TOKENS, query, stream_file
+    )
+    try:
+        subprocess.run(
+            curl_command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=LOCK_TIMEOUT_SEC,
+        )
+        with open(stream_file, "r", encoding="utf-8", errors="replace") as file:
+            text, error, stopped = service.parse_stream_response(file.read())
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    finally:
+        delete_file(stream_file)
+    if error or not stopped or not text.strip():
+        return None
+    return text.strip()
+
+
+def read_messages(chat_file, size):
+    """返回对话的前 size 字节（SQLite 存储中为前 size 条）中的消息；旧格式返回 None"""
+    if use_database():
+        return read_chat(chat_file)[:size]
+    with open(chat_file, "rb") as file:
+        raw = file.read(size)
+    if raw.lstrip().startswith(b"["):
+        # 旧格式的对话会在下一次追加消息时转换，之后再生成摘要
+        return None
+    return decode_lines(raw)
+
+
+def summarize(chat_file, size, kept):
+    decoded = read_messages(chat_file, size)
+    if decoded is None:
+        return
+    collapsed = list(collapse_answers(reversed(decoded), selected_label()))
+    messages = [
+        {"role": message["role"], "content": message.get("content") or ""}
+        for message in reversed(collapsed)
+    ]
+    evicted = messages[: max(0, len(messages) - kept)]
+
+    summary = read_summary(chat_file) or {}
+    covers = summary.get("covers", 0)
+    if covers > len(evicted) or summary.get("digest") != digest(evicted[:covers]):
+        # 对话被改写过，或摘要与这次的消息对不上，从头生成
+        summary, covers = {}, 0
+    if covers == len(evicted):
+        return
+
+    service = load_service(
+        summary_service(), env_var("http_proxy"), env_var("socks5_proxy")
+    )
+    if service is None:
+        return
+    text = summary.get("text", "")
+    for batch in batches(evicted[covers:]):
+        text = ask_model(service, text, batch, env_var("alfred_workflow_cache"))
+        if text is None:
+            return
+        covers += len(batch)
+        # 每批完成后立即保存，中途失败时下次从这里继续
+        write_summary(
+            chat_file,
+            {"covers": covers, "digest": digest(evicted[:covers]), "text": text},
+        )
+
+
+if __name__ == "__main__":
+    try:
+        summarize(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+    finally:
+        delete_file(lock_path())
@@ -0,0 +1,148 @@
+"""
+按 token 预算（而不是消息条数）从对话末尾挑选上下文。
+
+默认使用离线的字符比例估算；设置 context_tokenizer=tiktoken 且已安装 tiktoken 时改用 BPE 分词
+（词表由 tiktoken 缓存在 alfred_workflow_cache/tiktoken 下）。每条消息的 token 数按内容哈希缓存。
+并行模式（fanout.py）下同一个问题的多条回答在上下文中只保留一条（见 collapse_answers）。
+"""
+
+import hashlib
+import os
+from itertools import islice
+
+import json_codec
+from chat_store import iter_reverse
+from helper import env_var, file_exists, write_file
+
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD = 4
+# ASCII 文本约 4 个字符 1 个 token；中日韩等非 ASCII 字符约 1 个字符 1 个 token
+ASCII_CHARS_PER_TOKEN = 4.0
+MEMO_LIMIT = 4096
+
+
+def estimate_chars(text):
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return int((ascii_chars / ASCII_CHARS_PER_TOKEN) + (len(text) - ascii_chars)) + 1
+
+
+def load_tiktoken(cache_dir):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(cache_dir, "tiktoken"))
+    try:
+        encoding = tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # 词表未缓存且无法下载时回退到字符估算
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+TOKENIZERS = {"tiktoken": load_tiktoken}
+
+
+def token_budget(provider):
+    """返回该服务商的上下文 token 预算；0 表示沿用 max_context 条数限制"""
+    value = env_var(f"{provider}_context_tokens") or env_var("context_tokens")
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+class TokenCounter:
+    def __init__(self, cache_dir, tokenizer_name=""):
+        loader = TOKENIZERS.get(tokenizer_name)
+        tokenizer = loader(cache_dir) if loader else None
+        self.name = tokenizer_name if tokenizer else "chars"
+        self.tokenize = tokenizer or estimate_chars
+        self.memo_file = os.path.join(cache_dir, "token_counts.json")
+        self.memo = {}
+        self.dirty = False
+        if file_exists(self.memo_file):
+            with open(self.memo_file, "r", encoding="utf-8") as file:
+                self.memo = json_codec.loads(file.read())
+
+    def count(self, text):
+        if not text:
+            return 0
+        key = self.name + ":" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        tokens = self.memo.get(key)
+        if tokens is None:
+            tokens = self.tokenize(text)
+            self.memo[key] = tokens
+            self.dirty = True
+        return tokens
+
+    def save(self):
+        if not self.dirty:
+            return
+        # 只保留最近写入的条目，避免缓存无限增长
+        items = list(self.memo.items())[-MEMO_LIMIT:]
+        write_file(self.memo_file, json_codec.dumps(dict(items)))
+
+
+def selected_label():
+    """当前服务商的显示名称，与对话中回答的 provider 字段一致"""
+    from providers import PROVIDERS
+
+    provider = PROVIDERS.get(env_var("selected_llm_service"))
+    return provider["label"] if provider else None
+
+
+def pick_answer(answers, label):
+    # answers 由新到旧，没有当前服务商的回答时取最先写入的一条
+    for message in answers:
+        if message.get("provider") == label:
+            return message
+    return answers[-1]
+
+
+def collapse_answers(messages, label):
+    """
+    messages 为由新到旧的消息。并行模式把各服务商对同一个问题的回答依次写入对话，
+    连续多条带 provider 字段的回答只保留一条（优先 label 的回答），
+    避免重复占用上下文预算，也避免连续的 assistant 消息被要求严格交替的接口拒绝。
+    """
+    answers = []
+    for message in messages:
+        if message.get("role") == "assistant" and message.get("provider"):
+            answers.append(message)
+            continue
+        if answers:
+            yield pick_answer(answers, label)
+            answers = []
+        yield message
+    if answers:
+        yield pick_answer(answers, label)
+
+
+def recent_messages(chat_file, count, label):
+    """对话末尾的 count 条消息（合并并行模式的回答后计数）"""
+    if count <= 0:
+        return []
+    messages = list(islice(collapse_answers(iter_reverse(chat_file), label), count))
+    messages.reverse()
+    return messages
+
+
+def build_context(chat_file, query_message, system_prompt, budget, counter, label):
+    """
+    从最新的消息开始向前累加，直到超出预算；系统提示词与本次提问总是计入且总是发送。
+    """
+    used = counter.count(system_prompt) + counter.count(query_message["content"])
+    used += MESSAGE_OVERHEAD * (2 if system_prompt else 1)
+
+    context_chat = [query_message]
+    for message in collapse_answers(iter_reverse(chat_file), label):
+        cost = counter.count(message.get("content") or "") + MESSAGE_OVERHEAD
+        if used + cost > budget:
+            break
+        context_chat.append(message)
+        used += cost
+
+    context_chat.reverse()
+    counter.save()
+    return context_chat
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
-from helper import env_var, markdown_chat, read_chat
+from chat_render import render_chat
+from helper import env_var
 
 
 def run():
     chat_file = f"{env_var('alfred_workflow_data')}/chat.json"
-    return markdown_chat(read_chat(chat_file), False)
+    return render_chat(chat_file, env_var("alfred_workflow_cache"), False)
 
 
 if __name__ == "__main__":
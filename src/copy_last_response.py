@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 
-from helper import env_var, read_chat
+from chat_store import last_by_role
+from helper import env_var
 
 
 def run():
     chat_file = f"{env_var('alfred_workflow_data')}/chat.json"
-    messages = read_chat(chat_file)
-    last_assistant = next((m for m in reversed(messages) if m.get("role") == "assistant"), None)
+    last_assistant = last_by_role(chat_file, "assistant")
     content = last_assistant.get("content") if last_assistant else None
     if not content:
         return ""
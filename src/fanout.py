@@ -0,0 +1,187 @@
+"""
+多服务商并行模式：同一个问题同时发给 fanout_services 中配置的多个服务商。
+
+每个服务商使用自己的流文件、pid 文件与解析状态（alfred_workflow_cache/fanout_<key>.*），
+stream.txt 只作为“仍在回答”的标记，pid.txt 中以空格分隔列出全部 curl 进程。
+各服务商的回答分段展示，哪个先结束就先写入对话，不必等待其他服务商。
+竞速模式（race.py）复用同一套文件，只保留最先输出内容的服务商。
+"""
+
+import os
+import time
+
+import json_codec
+from helper import assistant_signature, delete_file, env_var, file_exists, write_file
+from providers import PROVIDERS, load_service
+from rerun_schedule import next_interval, rerun_bounds
+
+
+def fanout_services():
+    """返回配置的服务商列表；少于两个时不启用并行模式"""
+    keys = [key.strip() for key in env_var("fanout_services").split(",")]
+    keys = [key for key in dict.fromkeys(keys) if key in PROVIDERS]
+    return keys if len(keys) > 1 else []
+
+
+def service_files(cache_dir, key):
+    base = os.path.join(cache_dir, f"fanout_{key}")
+    return f"{base}.txt", f"{base}.pid", f"{base}.json"
+
+
+def progress_path(cache_dir):
+    return os.path.join(cache_dir, "fanout.json")
+
+
+def read_pids(cache_dir, keys):
+    pids = []
+    for key in keys:
+        pid_file = service_files(cache_dir, key)[1]
+        if file_exists(pid_file):
+            with open(pid_file, "r", encoding="utf-8") as file:
+                pid = file.read().strip()
+            if pid:
+                pids.append(pid)
+    return " ".join(pids)
+
+
+def start_fanout(
+    keys,
+    http_proxy,
+    socks5_proxy,
+    max_tokens,
+    system_prompt,
+    context_chat,
+    stream_file,
+    pid_stream_file,
+    cache_dir,
+):
+    started = time.time()
+    write_file(stream_file, "")
+    for key in keys:
+        service = load_service(key, http_proxy, socks5_proxy)
+        key_stream_file, key_pid_file, key_state_file = service_files(cache_dir, key)
+        # start_stream 会就地修改上下文，每个服务商使用各自的副本
+        service.start_stream(
+            max_tokens,
+            system_prompt,
+            list(context_chat),
+            key_stream_file,
+            key_pid_file,
+            key_state_file,
+        )
+
+    write_file(pid_stream_file, read_pids(cache_dir, keys))
+    write_file(
+        progress_path(cache_dir),
+        json_codec.dumps({"started": started, "services": keys, "done": {}}),
+    )
+
+
+def render_sections(keys, sections):
+    return "\n\n".join(
+        assistant_signature(PROVIDERS[key]["label"]) + sections[key] for key in keys
+    )
+
+
+def render_footer(keys, done):
+    parts = []
+    for key in keys:
+        if key in done:
+            part = f"{PROVIDERS[key]['label']} {done[key]['elapsed']}s"
+            if done[key]["footer"]:
+                part = f"{part} {done[key]['footer']}"
+            parts.append(part)
+    return " · ".join(parts)
+
+
+def read_fanout(
+    cache_dir,
+    chat_file,
+    stream_file,
+    pid_stream_file,
+    stream_marker,
+    http_proxy,
+    socks5_proxy,
+):
+    with open(progress_path(cache_dir), "r", encoding="utf-8") as file:
+        progress = json_codec.loads(file.read())
+    keys = progress["services"]
+    done = progress["done"]
+
+    if stream_marker:
+        return json_codec.dumps(
+            {
+                "rerun": rerun_bounds()[0],
+                "variables": {"streaming_now": True},
+                "response": render_sections(keys, {key: "..." for key in keys}),
+                "behaviour": {"response": "append"},
+            },
+            ensure_ascii=False,
+        )
+
+    sections = {}
+    reruns = []
+    pending = []
+    for key in keys:
+        if key in done:
+            sections[key] = done[key]["response"]
+            continue
+
+        service = load_service(key, http_proxy, socks5_proxy)
+        key_stream_file, key_pid_file, key_state_file = service_files(cache_dir, key)
+        state, text, error, status, idle = service.poll_stream(
+            key_stream_file, key_state_file
+        )
+        if status in ("waiting", "streaming"):
+            sections[key] = text or "..."
+            reruns.append(next_interval(state, idle))
+            pending.append(key)
+            continue
+
+        response, footer = service.commit_stream(
+            chat_file,
+            key_stream_file,
+            key_pid_file,
+            key_state_file,
+            state,
+            text,
+            error,
+            status,
+            PROVIDERS[key]["label"],
+        )
+        done[key] = {
+            "response": response,
+            "footer": footer,
+            "elapsed": round(time.time() - progress["started"], 1),
+        }
+        sections[key] = response
+
+    response = render_sections(keys, sections)
+    footer = render_footer(keys, done)
+
+    if pending:
+        write_file(progress_path(cache_dir), json_codec.dumps(progress))
+        # 已结束的服务商不再需要被中断
+        write_file(pid_stream_file, read_pids(cache_dir, pending))
+        return json_codec.dumps(
+            {
+                "rerun": min(reruns),
+                "variables": {"streaming_now": True},
+                "response": response,
+                "footer": footer,
+                "behaviour": {"response": "replacelast"},
+            },
+            ensure_ascii=False,
+        )
+
+    delete_file(stream_file)
+    delete_file(pid_stream_file)
+    delete_file(progress_path(cache_dir))
+    return json_codec.dumps(
+        {
+            "response": response,
+            "footer": footer,
+            "behaviour": {"response": "replacelast", "scroll": "end"},
+        },
+        ensure_ascii=False,
+    )
@@ -1,11 +1,13 @@
-import json
 from typing import Optional, Tuple
 
+import json_codec
 from llm_service import LLMService
 
 
 class GeminiService(LLMService):
-    def construct_curl_command(self, max_tokens, messages, stream_file) -> list:
+    framing = "json_array"
+
+    def build_request(self, max_tokens, messages, system_prompt=None):
         """
         message here:
         [
@@ -14,6 +16,7 @@ class GeminiService(LLMService):
             {"role": "assistant", "content": "Hello! How can I help you today?"}
         ]
         """
+        messages = self.with_system_message(messages, system_prompt)
         content = [
             {
                 "parts": [{"text": message["content"]}],
@@ -28,84 +31,37 @@ class GeminiService(LLMService):
                 # "temperature": 0.8
             },
         }
+        headers = {"User-Agent": self.user_agent, "Content-Type": "application/json"}
+        url = (
+            f"{self.api_endpoint}/v1beta/models/{self.model}"
+            f":streamGenerateContent?key={self.api_key}"
+        )
+        return url, headers, data
 
-        return [
-            "curl",
-            f"{self.api_endpoint}/v1beta/models/{self.model}:streamGenerateContent?key={self.api_key}",
-            "--speed-limit",
-            "0",
-            "--speed-time",
-            str(self.stall_timeout_sec),  # Abort stalled connection after a few seconds
-            "--silent",
-            "--no-buffer",
-            "--header",
-            f"User-Agent: {self.user_agent}",
-            "--header",
-            "Content-Type: application/json",
-            "--data",
-            json.dumps(data),
-            "--output",
-            stream_file,
-        ] + self.proxy_option
-
-    def read_and_split_file(self, stream_string):
-        parts = []
-        current_part = []
-
-        lines = stream_string.strip().split("\n")
-        for line in lines:
-            if line.strip() == ",":
-                if current_part:
-                    parts.append("".join(current_part).strip())
-                    current_part = []
-            else:
-                current_part.append(line)
-
-        if current_part:  # Append the last part if exists
-            parts.append("".join(current_part).strip())
+    def is_error_body(self, head) -> bool:
+        return head.strip().startswith("{")
 
-        has_stopped = False
-        processed_parts = []
-        for part in parts:
-            if part.startswith("["):
-                part = part[1:]
-            if part.endswith("]"):
-                part = part[:-1]
-                has_stopped = True
-            processed_parts.append(part)
-        return processed_parts, has_stopped
-
-    def parse_stream_response(self, stream_string) -> Tuple[str, Optional[str], bool]:
+    def parse_error_body(self, stream_string) -> Tuple[str, Optional[str], bool]:
         # 统一错误呈现：若响应为一次性 JSON 错误体，则直接回显错误信息
-        if stream_string.strip().startswith("{"):
-            try:
-                obj = json.loads(stream_string)
-            except Exception:
-                return "Response body is not valid json.", "", True
-            err = obj.get("error") or {}
-            if err:
-                return err.get("message", "Unknown Error"), "", True
-            return json.dumps(obj, ensure_ascii=False), "", True
-
-        parts, has_stopped = self.read_and_split_file(stream_string)
-
-        chunks = []
-        current_event = {}
-
-        for part in parts:
-            try:
-                current_event = json.loads(part)
-            except json.JSONDecodeError:
-                continue
-            chunks.append(current_event)
+        try:
+            obj = json_codec.loads(stream_string)
+        except Exception:
+            return "Response body is not valid json.", "", True
+        err = obj.get("error") or {}
+        if err:
+            return err.get("message", "Unknown Error"), "", True
+        return json_codec.dumps(obj, ensure_ascii=False), "", True
 
-        response_text = ""
-        error_message = None
-        for current_event in chunks:
-            candidates = current_event.get("candidates", [])
-            first_candidate = candidates[0] if len(candidates) > 0 else {}
-            content = first_candidate.get("content", {})
-            parts = content.get("parts", [])
-            first_part = parts[0] if len(parts) > 0 else {}
-            response_text += first_part.get("text", "")
-        return response_text, error_message, has_stopped
+    def handle_event(self, state, event, payload, pieces):
+        if event == "end":
+            state["stopped"] = True
+            return False
+        if not isinstance(payload, dict):
+            return False
+        candidates = payload.get("candidates", [])
+        first_candidate = candidates[0] if len(candidates) > 0 else {}
+        content = first_candidate.get("content", {})
+        parts = content.get("parts", [])
+        first_part = parts[0] if len(parts) > 0 else {}
+        pieces.append(first_part.get("text", ""))
+        return False
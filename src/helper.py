@@ -1,7 +1,7 @@
-import json
 import os
 import shutil
-from pathlib import Path
+
+import json_codec
 
 
 def env_var(var_name):
@@ -12,7 +12,9 @@ def user_signature():
     return "**You:**\n\n"
 
 
-def assistant_signature():
+def assistant_signature(label=None):
+    if label:
+        return f"**Assistant · {label}:**\n\n"
     return "**Assistant:**\n\n"
 
 
@@ -23,9 +25,9 @@ def make_dir(path):
 def dir_contents(path):
     return sorted(
         [
-            str(p)
-            for p in Path(path).iterdir()
-            if p.is_file() and not p.name.startswith(".")
+            entry.path
+            for entry in os.scandir(path)
+            if entry.is_file() and not entry.name.startswith(".")
         ]
     )
 
@@ -52,48 +54,39 @@ def write_file(path, text):
         file.write(text)
 
 
-def read_chat(path):
-    if not file_exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as file:
-        chat_string = file.read()
-    return json.loads(chat_string)
-
-
 def trash_chat(path):
     shutil.move(path, os.path.expanduser("~/.Trash"))
 
 
-def append_chat(path, message):
-    ongoing_chat = read_chat(path) + [message]
-    chat_string = json.dumps(ongoing_chat)
-    write_file(path, chat_string)
+def markdown_message(current, next_message, ignore_last_interrupted=True):
+    """渲染单条消息；用户消息是否标记为中断只取决于下一条消息"""
+    role = current.get("role")
+    content = current.get("content") or ""
+    if role == "assistant":
+        return assistant_signature(current.get("provider")) + content + "\n\n---\n"
+    if role == "user":
+        user_twice = next_message is not None and next_message.get("role") == "user"
+        last_message = next_message is None
+        if user_twice or (last_message and not ignore_last_interrupted):
+            return f"{user_signature()}{content}\n\n[Answer Interrupted]\n\n---\n"
+        return f"{user_signature()}{content}\n\n---\n"
+    return "---\n"
 
 
 def markdown_chat(messages, ignore_last_interrupted=True):
-    result = ""
-    for index, current in enumerate(messages):
-        role = current.get("role")
-        content = current.get("content") or ""
-        if role == "assistant":
-            result += assistant_signature() + content + "\n\n"
-        elif role == "user":
-            lines = content.split("\n") if content else []
-            user_message = user_signature() + "\n".join(f"{line}" for line in lines)
-            user_twice = (
-                index + 1 < len(messages) and messages[index + 1].get("role") == "user"
-            )
-            last_message = index == len(messages) - 1
-            if user_twice or (last_message and not ignore_last_interrupted):
-                result += f"{user_message}\n\n[Answer Interrupted]\n\n"
-            else:
-                result += f"{user_message}\n\n"
-        result += "---\n"
-    return result
+    count = len(messages)
+    return "".join(
+        markdown_message(
+            current,
+            messages[index + 1] if index + 1 < count else None,
+            ignore_last_interrupted,
+        )
+        for index, current in enumerate(messages)
+    )
 
 
 def no_archives():
-    return json.dumps(
+    return json_codec.dumps(
         {
             "items": [
                 {
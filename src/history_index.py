@@ -0,0 +1,118 @@
+"""
+历史对话列表的索引：archive_index.json 记录每个对话文件的首个/最后一个问题、消息数、mtime 与 size。
+
+chat_history.py 每次按键都会运行；有了索引后只需 stat 各文件，mtime/size 未变化的对话不必再解析。
+"""
+
+import os
+
+import json_codec
+from archive_store import loose_paths, packed_chats
+from chat_store import read_chat, stat_chat, use_database
+from helper import file_exists, write_file
+
+INDEX_VERSION = 1
+# 列表只展示和匹配问题的开头部分，索引中无需保存完整内容
+QUESTION_LIMIT = 300
+
+
+def index_path(data_dir):
+    return os.path.join(data_dir, "archive_index.json")
+
+
+def load_index(data_dir):
+    path = index_path(data_dir)
+    if file_exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            index = json_codec.loads(file.read())
+        if index.get("version") == INDEX_VERSION:
+            return index["entries"]
+    return {}
+
+
+def save_index(data_dir, entries):
+    write_file(
+        index_path(data_dir),
+        json_codec.dumps(
+            {"version": INDEX_VERSION, "entries": entries}, ensure_ascii=False
+        ),
+    )
+
+
+def summarize_chat(path, stat):
+    messages = read_chat(path)
+    questions = [m.get("content") for m in messages if m.get("role") == "user"]
+    return {
+        "first": (questions[0] or "")[:QUESTION_LIMIT] if questions else "",
+        "last": (questions[-1] or "")[:QUESTION_LIMIT] if questions else "",
+        "count": len(messages),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+    }
+
+
+def is_fresh(entry, stat):
+    return (
+        entry is not None
+        and entry["mtime"] == stat.st_mtime
+        and entry["size"] == stat.st_size
+    )
+
+
+def update_entry(data_dir, path):
+    """归档后调用：立即为新文件建立索引"""
+    entries = load_index(data_dir)
+    entries[os.path.basename(path)] = summarize_chat(path, stat_chat(path))
+    save_index(data_dir, entries)
+
+
+def remove_entry(data_dir, name):
+    entries = load_index(data_dir)
+    if entries.pop(name, None) is not None:
+        save_index(data_dir, entries)
+
+
+def chat_files(data_dir):
+    """
+    归档文件按名称（即时间）排序，当前对话 chat.json 排在最后。
+    打包进段文件的对话只读各段的索引，不必逐个 stat；同名的散文件优先。
+    """
+    if use_database():
+        import chat_db
+
+        return chat_db.chat_files(data_dir)
+    archive_dir = os.path.join(data_dir, "archive")
+    loose = {path: os.stat(path) for path in loose_paths(archive_dir)}
+    packed = [item for item in packed_chats(archive_dir) if item[0] not in loose]
+    files = sorted(list(loose.items()) + packed)
+    ongoing_chat = os.path.join(data_dir, "chat.json")
+    if file_exists(ongoing_chat):
+        files.append((ongoing_chat, os.stat(ongoing_chat)))
+    return files
+
+
+def refresh_index(data_dir):
+    """返回 [(path, entry)]；只重新解析新增或 mtime/size 变化的文件，并清理已不存在的条目"""
+    entries = load_index(data_dir)
+    changed = False
+    result = []
+    seen = set()
+
+    for path, stat in chat_files(data_dir):
+        name = os.path.basename(path)
+        seen.add(name)
+        entry = entries.get(name)
+        if not is_fresh(entry, stat):
+            entry = summarize_chat(path, stat)
+            entries[name] = entry
+            changed = True
+        result.append((path, entry))
+
+    for name in list(entries):
+        if name not in seen:
+            del entries[name]
+            changed = True
+
+    if changed:
+        save_index(data_dir, entries)
+    return result
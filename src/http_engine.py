@@ -0,0 +1,290 @@
+"""
+stream_daemon.py 使用的异步 HTTP 流式请求引擎，代替为每个请求启动一个 curl。
+
+默认实现只依赖标准库：asyncio 连接加上一个 HTTP/1.1 响应读取器（支持 chunked、
+Content-Length 与读到连接关闭为止三种响应体）；安装了 httpx[socks]（0.28 及以上）时改用 httpx。两者都：
+  - 按 (scheme, host, port, 代理) 复用 keep-alive 连接；
+  - 支持 HTTP 代理（https 经 CONNECT 隧道）与 SOCKS5 代理（由代理解析域名，同 curl --socks5-hostname）；
+  - 超过 stall_timeout 秒没有收到任何字节即放弃，对应 curl 的 --speed-limit 0 --speed-time。
+响应体按原样交给 write(data)，与 curl --output 一样不区分状态码；write 返回 False 时中止请求。
+"""
+
+import asyncio
+import socket
+import ssl
+import struct
+from urllib.parse import urlsplit
+
+CHUNK_SIZE = 16384
+
+
+def split_host_port(address, default_port):
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, default_port
+    return host, int(port)
+
+
+def recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise OSError("Connection closed by proxy")
+        data += chunk
+    return data
+
+
+def socks5_connect(proxy, host, port, timeout):
+    proxy_host, proxy_port = split_host_port(proxy, 1080)
+    sock = socket.create_connection((proxy_host, proxy_port), timeout)
+    try:
+        sock.sendall(b"\x05\x01\x00")
+        if recv_exact(sock, 2) != b"\x05\x00":
+            raise OSError("SOCKS5 proxy rejected the authentication method")
+        # 与 curl --socks5-hostname 一致：由代理负责解析域名
+        name = host.encode("idna")
+        sock.sendall(
+            b"\x05\x01\x00\x03" + bytes([len(name)]) + name + struct.pack(">H", port)
+        )
+        reply = recv_exact(sock, 4)
+        if reply[1] != 0:
+            raise OSError(f"SOCKS5 connect failed with code {reply[1]}")
+        if reply[3] == 1:
+            recv_exact(sock, 4 + 2)
+        elif reply[3] == 4:
+            recv_exact(sock, 16 + 2)
+        else:
+            recv_exact(sock, recv_exact(sock, 1)[0] + 2)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def http_connect(proxy, host, port, timeout):
+    """经 HTTP 代理建立到 host:port 的 CONNECT 隧道"""
+    proxy_host, proxy_port = split_host_port(proxy, 8080)
+    sock = socket.create_connection((proxy_host, proxy_port), timeout)
+    try:
+        sock.sendall(
+            f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode()
+        )
+        head = b""
+        while b"\r\n\r\n" not in head:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise OSError("Connection closed by proxy")
+            head += chunk
+        status = head.split(b" ", 2)[1]
+        if status != b"200":
+            raise OSError(f"Proxy CONNECT failed with status {status.decode()}")
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+async def open_connection(scheme, host, port, http_proxy, socks5_proxy, timeout):
+    context = ssl.create_default_context() if scheme == "https" else None
+    tunnel = None
+    if socks5_proxy:
+        tunnel = (socks5_connect, socks5_proxy)
+    elif http_proxy and context:
+        tunnel = (http_connect, http_proxy)
+    elif http_proxy:
+        # 明文 http 直接发给代理，请求行中使用绝对 URL
+        host, port = split_host_port(http_proxy, 8080)
+
+    if tunnel is None:
+        connect = asyncio.open_connection(host, port, ssl=context)
+    else:
+        # 代理握手很短，在线程中用阻塞 socket 完成，再交给 asyncio（兼容 Python 3.9）
+        loop = asyncio.get_running_loop()
+        sock = await asyncio.wait_for(
+            loop.run_in_executor(None, tunnel[0], tunnel[1], host, port, timeout),
+            timeout,
+        )
+        sock.setblocking(False)
+        connect = asyncio.open_connection(
+            sock=sock, ssl=context, server_hostname=host if context else None
+        )
+    return await asyncio.wait_for(connect, timeout)
+
+
+async def read_head(reader, timeout):
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def read_body(reader, headers, write, timeout):
+    """把响应体交给 write；返回 True 表示完整读完且连接可以复用"""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            size = int(line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # 跳过可能存在的 trailer
+                while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                    pass
+                return True
+            while size > 0:
+                data = await asyncio.wait_for(
+                    reader.read(min(size, CHUNK_SIZE)), timeout
+                )
+                if not data:
+                    raise OSError("Connection closed inside a chunk")
+                size -= len(data)
+                if not write(data):
+                    return False
+            await asyncio.wait_for(reader.readexactly(2), timeout)
+
+    remaining = headers.get("content-length")
+    remaining = int(remaining) if remaining is not None else None
+    while remaining is None or remaining > 0:
+        size = CHUNK_SIZE if remaining is None else min(remaining, CHUNK_SIZE)
+        data = await asyncio.wait_for(reader.read(size), timeout)
+        if not data:
+            # 没有 Content-Length 时以连接关闭表示结束，此时连接不能复用
+            if remaining is None:
+                return False
+            raise OSError("Connection closed before the body was complete")
+        if remaining is not None:
+            remaining -= len(data)
+        if not write(data):
+            return False
+    return True
+
+
+class AsyncioEngine:
+    name = "asyncio"
+
+    def __init__(self):
+        self.pool = {}
+
+    async def checkout(self, key, timeout):
+        idle = self.pool.get(key) or []
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        return (await open_connection(*key, timeout)) + (False,)
+
+    def checkin(self, key, reader, writer):
+        self.pool.setdefault(key, []).append((reader, writer))
+
+    async def stream(self, request, write, stall_timeout):
+        url = urlsplit(request["url"])
+        https = url.scheme == "https"
+        port = url.port or (443 if https else 80)
+        http_proxy = request.get("http_proxy") or ""
+        socks5_proxy = request.get("socks5_proxy") or ""
+        key = (url.scheme, url.hostname, port, http_proxy, socks5_proxy)
+        # 经 HTTP 代理访问明文 http 时需要使用绝对 URL
+        target = request["url"] if http_proxy and not https else url.path
+        if url.query and target == url.path:
+            target = f"{target}?{url.query}"
+        body = request["data"].encode("utf-8")
+        headers = dict(request["headers"], Host=url.netloc)
+        headers["Content-Length"] = str(len(body))
+        head = f"POST {target} HTTP/1.1\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in headers.items()
+        )
+        message = head.encode("latin-1") + b"\r\n" + body
+
+        for attempt in range(2):
+            reader, writer, reused = await self.checkout(key, stall_timeout)
+            try:
+                writer.write(message)
+                await asyncio.wait_for(writer.drain(), stall_timeout)
+                _, response_headers = await read_head(reader, stall_timeout)
+                break
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+                # 复用的 keep-alive 连接可能已被服务端关闭，换新连接重试一次
+                if not reused or attempt == 1:
+                    raise
+
+        reusable = False
+        try:
+            reusable = await read_body(reader, response_headers, write, stall_timeout)
+            keep_alive = response_headers.get("connection", "").lower() != "close"
+            reusable = reusable and keep_alive
+        finally:
+            if reusable:
+                self.checkin(key, reader, writer)
+            else:
+                writer.close()
+
+    async def close(self):
+        for idle in self.pool.values():
+            for _, writer in idle:
+                writer.close()
+        self.pool.clear()
+
+
+class HttpxEngine:
+    name = "httpx"
+
+    def __init__(self, httpx):
+        self.httpx = httpx
+        self.clients = {}
+
+    def client(self, http_proxy, socks5_proxy):
+        proxy = None
+        if socks5_proxy:
+            # socks5h：由代理解析域名，与 curl --socks5-hostname 及 AsyncioEngine 一致
+            proxy = f"socks5h://{socks5_proxy}"
+        elif http_proxy:
+            proxy = f"http://{http_proxy}"
+        if proxy not in self.clients:
+            try:
+                self.clients[proxy] = self.httpx.AsyncClient(proxy=proxy)
+            except TypeError:
+                # httpx < 0.26 使用 proxies 参数
+                self.clients[proxy] = self.httpx.AsyncClient(proxies=proxy)
+        return self.clients[proxy]
+
+    async def stream(self, request, write, stall_timeout):
+        client = self.client(request.get("http_proxy"), request.get("socks5_proxy"))
+        try:
+            async with client.stream(
+                "POST",
+                request["url"],
+                headers=request["headers"],
+                content=request["data"].encode("utf-8"),
+                timeout=stall_timeout,
+            ) as response:
+                async for data in response.aiter_bytes():
+                    if not write(data):
+                        return
+        except self.httpx.HTTPError as error:
+            raise OSError(str(error)) from error
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+
+def make_engine():
+    """
+    httpx 需要 socksio 才能使用 SOCKS5 代理，且 0.28 起才支持 socks5h；
+    条件不满足时使用标准库实现，而不是到第一个经代理的请求才失败
+    """
+    try:
+        import httpx
+        import socksio  # noqa: F401
+
+        httpx.Proxy("socks5h://localhost:1080")
+    except (ImportError, ValueError):
+        return AsyncioEngine()
+    return HttpxEngine(httpx)
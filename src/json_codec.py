@@ -0,0 +1,114 @@
+"""
+JSON 编解码：可用时使用 orjson 或 ujson，否则使用标准库 json。
+
+各后端输出语义一致：
+  - 紧凑格式（无多余空格）；
+  - ensure_ascii=True 时非 ASCII 字符转义为 \\uXXXX，与标准库相同；
+  - 非字符串的键（int、float、bool、None）按标准库的规则转换为字符串；
+  - 加速后端无法处理的对象（超出 64 位的整数、孤立代理字符等）交给标准库处理。
+解析失败时抛出 ValueError 的子类。
+
+每次 rerun 都是新进程，加速后端的导入开销（orjson 会连带导入 datetime、uuid、zoneinfo 等）
+每次都要付出，而一次 rerun 中的载荷通常只有几 KB。因此默认只在单个载荷超过 LARGE_PAYLOAD
+时才加载加速后端（阈值取自 benchmarks/json_tick.py 测得的盈亏平衡点）；
+环境变量 json_backend（orjson/ujson/json）可指定后端并对所有载荷生效。
+"""
+
+import json
+import os
+
+BACKENDS = ("orjson", "ujson", "json")
+
+LARGE_PAYLOAD = 4 * 1024 * 1024
+
+FORCED_BACKEND = os.environ.get("json_backend")
+
+
+def stdlib_dumps(obj, ensure_ascii=True):
+    return json.dumps(obj, ensure_ascii=ensure_ascii, separators=(",", ":"))
+
+
+def make_codec(name):
+    """返回 (loads, dumps)；后端不可用时抛出 ImportError"""
+    if name == "orjson":
+        import orjson
+
+        def dumps(obj, ensure_ascii=True):
+            try:
+                out = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                return stdlib_dumps(obj, ensure_ascii)
+            # orjson 总是输出 UTF-8；含非 ASCII 字符且需要转义时交给标准库
+            if ensure_ascii and not out.isascii():
+                return stdlib_dumps(obj, ensure_ascii)
+            return out.decode("utf-8")
+
+        return orjson.loads, dumps
+
+    if name == "ujson":
+        import ujson
+
+        def dumps(obj, ensure_ascii=True):
+            if any(not isinstance(key, str) for key in nested_keys(obj)):
+                return stdlib_dumps(obj, ensure_ascii)
+            try:
+                return ujson.dumps(
+                    obj, ensure_ascii=ensure_ascii, escape_forward_slashes=False
+                )
+            except (TypeError, OverflowError):
+                return stdlib_dumps(obj, ensure_ascii)
+
+        return ujson.loads, dumps
+
+    if name == "json":
+        return json.loads, stdlib_dumps
+
+    raise ImportError(f"Unknown JSON backend: {name}")
+
+
+def nested_keys(obj):
+    """ujson 对 None/bool 键的转换与标准库不同，先找出所有键再决定是否使用它"""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            yield key
+            yield from nested_keys(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            yield from nested_keys(value)
+
+
+def select_codec(preferred=None):
+    """返回 (name, loads, dumps)，按 preferred、BACKENDS 的顺序取第一个可用的后端"""
+    for name in (preferred,) + BACKENDS if preferred else BACKENDS:
+        try:
+            return (name,) + make_codec(name)
+        except ImportError:
+            continue
+    return ("json",) + make_codec("json")
+
+
+fast_codec = None
+
+
+def codec_for(size):
+    global fast_codec
+    if size < LARGE_PAYLOAD and not FORCED_BACKEND:
+        return json.loads, stdlib_dumps
+    if fast_codec is None:
+        fast_codec = select_codec(FORCED_BACKEND)
+    return fast_codec[1:]
+
+
+def payload_size(obj):
+    """粗略估计输出大小：只统计顶层的字符串值，足以覆盖 response、text 等大字段"""
+    if isinstance(obj, dict):
+        return sum(len(value) for value in obj.values() if isinstance(value, str))
+    return 0
+
+
+def loads(data):
+    return codec_for(len(data))[0](data)
+
+
+def dumps(obj, ensure_ascii=True):
+    return codec_for(payload_size(obj))[1](obj, ensure_ascii)
@@ -1,21 +1,31 @@
-import json
 import os
-import subprocess
 import time
 from abc import ABC, abstractmethod
 from typing import Optional, Tuple
 
+import json_codec
+from chat_store import append_chat
 from helper import (
-    append_chat,
     assistant_signature,
     delete_file,
     env_var,
+    file_exists,
     file_modified,
     write_file,
 )
+from metrics import mark_progress
+from rerun_schedule import next_interval, observe, rerun_bounds
+from stream_decoder import DECODERS
+
+
+# 游标中保存的已发送文本结尾，用来确认新文本是已发送内容的延续
+CURSOR_TAIL = 64
 
 
 class LLMService(ABC):
+    # 响应流的分帧方式：sse / ndjson / json_array
+    framing = "sse"
+
     def __init__(
         self, api_endpoint, api_key, model, http_proxy=None, socks5_proxy=None
     ):
@@ -23,6 +33,8 @@ class LLMService(ABC):
         self.api_key = api_key
         self.model = model
         self.user_agent = "Alfred-Chathub"
+        # 与 providers.PROVIDERS 中的键一致，例如 OpenaiService -> openai
+        self.provider = type(self).__name__[: -len("Service")].lower()
         # 解析全局卡顿判定超时时间；限定允许值集合并设定安全缺省
         timeout_str = env_var("stall_timeout_sec") or "30"
         try:
@@ -31,6 +43,17 @@ class LLMService(ABC):
             timeout_val = 30
         self.stall_timeout_sec = timeout_val if timeout_val in {15, 30, 60, 120} else 30
 
+        self.http_proxy = http_proxy or ""
+        self.socks5_proxy = socks5_proxy or ""
+        # 可选：由常驻守护进程发起请求并复用 keep-alive 连接，代替每次启动 curl
+        self.stream_daemon = env_var("stream_daemon") == "1"
+        # 可选：相同请求直接回放缓存的响应流
+        self.response_cache = env_var("response_cache") == "1"
+        # 可选：流式输出时只向 Alfred 追加新增的文本，代替每次重发整段回答
+        self.stream_deltas = env_var("stream_deltas") == "1"
+        # 可选：为支持的服务商设置提示词缓存断点，并统计命中缓存的输入 token
+        self.prompt_cache = env_var("prompt_cache") == "1"
+
         if http_proxy:
             self.proxy_option = ["-x", f"http://{http_proxy}"]
         elif socks5_proxy:
@@ -39,13 +62,147 @@ class LLMService(ABC):
             self.proxy_option = []
 
     @abstractmethod
-    def construct_curl_command(self, max_tokens, messages, stream_file) -> list:
-        pass
+    def build_request(
+        self, max_tokens, messages, system_prompt=None
+    ) -> Tuple[str, dict, dict]:
+        """
+        返回 (url, 请求头, 请求体)；curl 命令、守护进程的请求与响应缓存的键都由它生成。
+        system_prompt 放在哪里由各服务商决定，多数作为第一条 system 消息（见 with_system_message）。
+        """
+
+    def with_system_message(self, messages, system_prompt):
+        if not system_prompt:
+            return messages
+        return [{"role": "system", "content": system_prompt}] + messages
+
+    def construct_curl_command(
+        self, max_tokens, messages, stream_file, system_prompt=None
+    ) -> list:
+        url, headers, data = self.build_request(
+            max_tokens, messages, system_prompt=system_prompt
+        )
+        return self.curl_command(url, headers, json_codec.dumps(data), stream_file)
+
+    def curl_command(self, url, headers, body, stream_file) -> list:
+        command = [
+            "curl",
+            url,
+            "--speed-limit",
+            "0",
+            "--speed-time",
+            str(self.stall_timeout_sec),  # Abort stalled connection after a few seconds
+            "--silent",
+            "--no-buffer",
+        ]
+        for name, value in headers.items():
+            command += ["--header", f"{name}: {value}"]
+        return command + [
+            "--data",
+            body,
+            "--output",
+            stream_file,
+        ] + self.proxy_option
 
     @abstractmethod
-    def parse_stream_response(self, stream_string) -> Tuple[str, Optional[str], bool]:
+    def handle_event(self, state, event, payload, pieces) -> bool:
+        """
+        处理分帧后的一个事件（见 stream_decoder.py）：新增文本追加到 pieces，
+        并就地更新 state 中的 error/stopped；服务端返回错误事件时另设 state["failed"]，
+        这样的流不会写入响应缓存。返回 True 表示之后的内容全部忽略。
+        state 在展示前会被浅拷贝后追加解析未完成的尾行，因此只能在其中保存不可变值。
+        """
         pass
 
+    def parse_stream_lines(self, state, lines, final=False):
+        """
+        增量解析若干完整的行。
+        final=True 表示这些行之后不会再有后续内容（需要冲刷尚未结束的事件）。
+        """
+        DECODERS[self.framing](state, lines, final, self.handle_event)
+
+    def is_error_body(self, head) -> bool:
+        # 非流式的一次性响应（通常是错误体）以 { 开头
+        return head.startswith("{")
+
+    def parse_error_body(self, stream_string) -> Tuple[str, Optional[str], bool]:
+        # 原样回显无法识别的一次性响应体
+        return stream_string.strip(), "", True
+
+    def new_stream_state(self):
+        return {"offset": 0, "text": "", "error": None, "stopped": False}
+
+    def parse_stream_response(self, stream_string) -> Tuple[str, Optional[str], bool]:
+        if self.is_error_body(stream_string):
+            return self.parse_error_body(stream_string)
+        state = self.new_stream_state()
+        self.parse_stream_lines(state, stream_string.split("\n"), final=True)
+        return state["text"], state["error"], state["stopped"]
+
+    def read_stream_state(self, stream_state_file):
+        if not file_exists(stream_state_file):
+            return self.new_stream_state()
+        with open(stream_state_file, "r", encoding="utf-8") as file:
+            return json_codec.loads(file.read())
+
+    def read_stream_file(self, stream_file, offset):
+        """返回 (offset 之后的新字节, 已收到的总字节数, 距最后一次写入的秒数)"""
+        with open(stream_file, "rb") as file:
+            file.seek(offset)
+            data = file.read()
+        return data, offset + len(data), time.time() - file_modified(stream_file)
+
+    def read_daemon_stream(self, stream_file, state):
+        # 守护进程把响应写入 stream_file 处的内存映射缓冲区，直接映射读取，不必经 socket 往返
+        from stream_buffer import read_buffer
+
+        buffered = read_buffer(stream_file, state["offset"])
+        if buffered is not None:
+            data, received, idle, done = buffered
+            if done and not data:
+                # 连接已结束且没有未读的字节，但解析器仍未判定结束：无需等满卡顿超时
+                idle = float("inf")
+            return data, received, idle
+
+        import stream_client
+
+        try:
+            header, data = stream_client.send_command(
+                {"cmd": "read", "id": state["daemon"], "cursor": state["offset"]}
+            )
+        except (OSError, ValueError):
+            header, data = {"ok": False}, b""
+        if not header["ok"]:
+            # 守护进程已退出，按卡顿处理并保留已收到的内容
+            return b"", state["offset"], float("inf")
+        return data, header["received"], header["idle"]
+
+    def advance_stream_state(self, data, state) -> Tuple[str, Optional[str], bool]:
+        """
+        解析 offset 之后新增的字节 data。offset 始终停在最后一个完整行之后，
+        未完成的尾行（以及被截断的 UTF-8 字符）留到下一次再读，只在展示用的副本中试解析。
+        """
+        if state["offset"] == 0 and self.is_error_body(
+            data.decode("utf-8", errors="ignore")
+        ):
+            # 一次性响应体很小，且可能跨多行，直接整体解析，不推进 offset；
+            # 错误以正文的形式返回（error 为空），这里标记为失败，不写入响应缓存
+            state["failed"] = True
+            return self.parse_error_body(data.decode("utf-8", errors="replace"))
+
+        end = data.rfind(b"\n") + 1
+        if end > 0:
+            lines = data[:end].decode("utf-8", errors="replace").split("\n")
+            self.parse_stream_lines(state, lines[:-1])
+            state["offset"] += end
+
+        view = dict(state)
+        tail = data[end:].decode("utf-8", errors="ignore")
+        self.parse_stream_lines(view, [tail] if tail else [], final=True)
+        if view.get("failed"):
+            # 错误事件可能位于尚未结束的尾行中，提交时看的是 state
+            state["failed"] = True
+        return view["text"], view["error"], view["stopped"]
+
     def remove_empty_assistant_messages(self, messages):
         i = 0
         while i < len(messages):
@@ -63,93 +220,339 @@ class LLMService(ABC):
         return messages
 
     def start_stream(
-        self, max_tokens, system_prompt, context_chat, stream_file, pid_stream_file
+        self,
+        max_tokens,
+        system_prompt,
+        context_chat,
+        stream_file,
+        pid_stream_file,
+        stream_state_file,
     ):
         write_file(stream_file, "")
+        delete_file(stream_state_file)
 
         while len(context_chat) > 0 and context_chat[0]["role"] == "assistant":
             context_chat.pop(0)
 
-        messages = (
-            [{"role": "system", "content": system_prompt}] + context_chat
-            if system_prompt
-            else context_chat
+        self.remove_empty_assistant_messages(context_chat)
+
+        request = self.build_request(
+            max_tokens, context_chat, system_prompt=system_prompt
         )
+        self.launch_stream(request, stream_file, pid_stream_file, stream_state_file)
 
-        self.remove_empty_assistant_messages(messages)
+    def launch_stream(self, request, stream_file, pid_stream_file, stream_state_file):
+        """request 为 build_request 返回的 (url, 请求头, 请求体)，请求体只序列化一次"""
+        url, headers, data = request
+        body = json_codec.dumps(data)
+        state = self.new_stream_state()
+        state["started"] = time.time()
+        if self.response_cache and self.replay_cached_response(
+            url, body, stream_file, pid_stream_file, state
+        ):
+            write_file(stream_state_file, json_codec.dumps(state, ensure_ascii=False))
+            return
 
-        curl_command = self.construct_curl_command(max_tokens, messages, stream_file)
+        if self.stream_daemon and self.start_daemon_stream(
+            url, headers, body, stream_file, state
+        ):
+            # 没有独立的子进程可供中断；守护进程发现 stream_file 被删除后会自行放弃该请求
+            write_file(pid_stream_file, "")
+            write_file(stream_state_file, json_codec.dumps(state, ensure_ascii=False))
+            return
 
+        # 延迟导入：rerun 时不需要 subprocess
+        import subprocess
+
+        curl_command = self.curl_command(url, headers, body, stream_file)
         with open(os.devnull, "w") as devnull:
             process = subprocess.Popen(curl_command, stdout=devnull, stderr=devnull)
 
         write_file(pid_stream_file, str(process.pid))
+        write_file(stream_state_file, json_codec.dumps(state, ensure_ascii=False))
 
-    def read_stream(self, stream_file, chat_file, pid_stream_file, stream_marker):
-        with open(stream_file, "r", encoding="utf-8") as file:
-            stream_string = file.read()
+    def replay_cached_response(self, url, body, stream_file, pid_stream_file, state):
+        from response_cache import ResponseCache, request_key
 
-        if stream_marker:
-            return json.dumps(
+        key = request_key(url, body)
+        data = ResponseCache(os.path.dirname(stream_file)).get(key)
+        if data is None:
+            state["cache"] = "miss"
+            state["cache_key"] = key
+            return False
+
+        # 把缓存的原始流写回 stream_file，之后与真实请求一样由 read_stream 解析
+        with open(stream_file, "wb") as file:
+            file.write(data)
+        write_file(pid_stream_file, "")
+        state["cache"] = "hit"
+        return True
+
+    def store_cached_response(self, stream_file, state):
+        from response_cache import ResponseCache
+
+        if state.get("daemon"):
+            data, _, _ = self.read_daemon_stream(stream_file, dict(state, offset=0))
+        else:
+            with open(stream_file, "rb") as file:
+                data = file.read()
+        if data:
+            ResponseCache(os.path.dirname(stream_file)).put(state["cache_key"], data)
+
+    def start_daemon_stream(self, url, headers, body, stream_file, state):
+        # 延迟导入：未启用守护进程时 rerun 不必加载 socket 相关模块
+        import stream_client
+
+        if not stream_client.ensure_daemon():
+            return False
+
+        stream_id = os.urandom(8).hex()
+        try:
+            header, _ = stream_client.send_command(
                 {
-                    "rerun": 0.1,
-                    "variables": {"streaming_now": True},
-                    "response": f"{assistant_signature()}...",
-                    "behaviour": {"response": "append"},
+                    "cmd": "start",
+                    "id": stream_id,
+                    "url": url,
+                    "headers": headers,
+                    "data": body,
+                    "http_proxy": self.http_proxy,
+                    "socks5_proxy": self.socks5_proxy,
+                    "stall_timeout": self.stall_timeout_sec,
+                    "marker": stream_file,
                 }
             )
+        except (OSError, ValueError):
+            return False
+        if not header["ok"]:
+            return False
+
+        state["daemon"] = stream_id
+        return True
+
+    def finish_stream(self, stream_file, pid_stream_file, stream_state_file, state):
+        delete_file(stream_file)
+        delete_file(pid_stream_file)
+        delete_file(stream_state_file)
+        if state.get("daemon"):
+            import stream_client
+
+            try:
+                stream_client.send_command({"cmd": "release", "id": state["daemon"]})
+            except (OSError, ValueError):
+                pass
 
-        if len(stream_string.strip()) > 0:
-            response_text, error_message, has_stopped = self.parse_stream_response(
-                stream_string
+    def cancel_stream(self, stream_file, pid_stream_file, stream_state_file):
+        """终止仍在进行的请求（与中断操作一样按 pid 结束 curl）并清理流文件"""
+        if file_exists(pid_stream_file):
+            with open(pid_stream_file, "r", encoding="utf-8") as file:
+                pid = file.read().strip()
+            if pid:
+                import signal
+
+                try:
+                    os.kill(int(pid), signal.SIGTERM)
+                except (ProcessLookupError, ValueError):
+                    pass
+        state = self.read_stream_state(stream_state_file)
+        self.finish_stream(stream_file, pid_stream_file, stream_state_file, state)
+
+    def poll_stream(self, stream_file, stream_state_file):
+        """
+        读取一次流的进度，返回 (state, text, error, status, idle)。
+        status：waiting 尚未收到字节，streaming 仍在接收，stopped 已结束，stalled 超时无数据。
+        """
+        state = self.read_stream_state(stream_state_file)
+        if state.get("daemon"):
+            data, received, idle = self.read_daemon_stream(stream_file, state)
+        else:
+            if state["offset"] > os.path.getsize(stream_file):
+                # 流文件已被重建（例如中断后重新提问），旧的解析状态作废
+                state = self.new_stream_state()
+            data, received, idle = self.read_stream_file(stream_file, state["offset"])
+
+        if received > 0:
+            response_text, error_message, has_stopped = self.advance_stream_state(
+                data, state
             )
         else:
             response_text, error_message, has_stopped = "", "", False
+        mark_progress(state, received, response_text, time.time())
 
-        stalled = time.time() - file_modified(stream_file) > self.stall_timeout_sec
+        if idle > self.stall_timeout_sec:
+            status = "stalled"
+        elif received == 0:
+            status = "waiting"
+        elif not has_stopped:
+            observe(state, received, time.time())
+            write_file(stream_state_file, json_codec.dumps(state, ensure_ascii=False))
+            status = "streaming"
+        else:
+            status = "stopped"
+        return state, response_text, error_message, status, idle
 
-        if stalled:
+    def commit_stream(
+        self,
+        chat_file,
+        stream_file,
+        pid_stream_file,
+        stream_state_file,
+        state,
+        response_text,
+        error_message,
+        status,
+        label=None,
+    ):
+        """把结束（或卡顿）的回答写入对话并清理流文件，返回 (展示的回答, footer)"""
+        self.record_metrics(stream_file, state, response_text, error_message, status)
+        message = {"role": "assistant"}
+        if label:
+            message["provider"] = label
+
+        if status == "stalled":
             if response_text:
-                append_chat(chat_file, {"role": "assistant", "content": response_text})
-            delete_file(stream_file)
-            delete_file(pid_stream_file)
-            return json.dumps(
-                {
-                    "response": f"{response_text} [Connection Stalled]",
-                    "footer": "You can ask the assistant to continue the answer",
-                    "behaviour": {"response": "replacelast", "scroll": "end"},
-                }
+                append_chat(chat_file, dict(message, content=response_text))
+            self.finish_stream(stream_file, pid_stream_file, stream_state_file, state)
+            return (
+                f"{response_text} [Connection Stalled]",
+                "You can ask the assistant to continue the answer",
             )
 
-        if not stream_string:
-            return json.dumps({"rerun": 0.1, "variables": {"streaming_now": True}})
+        append_chat(
+            chat_file, dict(message, content=response_text or error_message or "")
+        )
+        if state.get("cache_key") and not error_message and not state.get("failed"):
+            self.store_cached_response(stream_file, state)
+        self.finish_stream(stream_file, pid_stream_file, stream_state_file, state)
+
+        footer_parts = []
+        if error_message:
+            response_text = f"{response_text} [Error: {error_message}]"
+            footer_parts.append(f"[{error_message}]")
+        if state.get("cache"):
+            footer_parts.append(f"Cache {state['cache']}")
+        if self.prompt_cache and state.get("input_tokens"):
+            footer_parts.append(
+                f"Prompt cache {state['cached_tokens']}/{state['input_tokens']} tokens"
+            )
+        return response_text, " · ".join(footer_parts)
+
+    def record_metrics(self, stream_file, state, response_text, error_message, status):
+        import metrics
+
+        record = metrics.build_record(
+            self.provider,
+            self.model,
+            state,
+            response_text,
+            status,
+            error_message,
+            time.time(),
+        )
+        metrics.append_record(os.path.dirname(stream_file), record)
+
+    def cursor_path(self, stream_file):
+        return os.path.join(os.path.dirname(stream_file), "stream_cursor.json")
 
-        if not has_stopped:
-            return json.dumps(
+    def read_cursor(self, cursor_file):
+        """返回上次发给 Alfred 的位置 {"shown": 字符数, "tail": 结尾的一小段}，尚未发送时返回 None"""
+        if not file_exists(cursor_file):
+            return None
+        with open(cursor_file, "r", encoding="utf-8") as file:
+            return json_codec.loads(file.read())
+
+    def write_cursor(self, cursor_file, text):
+        cursor = {"shown": len(text), "tail": text[-CURSOR_TAIL:]}
+        write_file(cursor_file, json_codec.dumps(cursor, ensure_ascii=False))
+
+    def delta_output(self, cursor, text, stream_file, chat_file):
+        """
+        增量模式下返回 (response, behaviour)：
+          - 尚未发送过：replacelast 替换 stream_marker 追加的 "..."；
+          - text 是已发送内容的延续：append 只发送新增的部分；
+          - 已发送的部分被改写（例如流中途报错替换了全文）：replace 重绘整段对话。
+        """
+        if cursor is None:
+            return assistant_signature() + text, "replacelast"
+        shown, tail = cursor["shown"], cursor["tail"]
+        if len(text) >= shown and text[shown - len(tail) : shown] == tail:
+            return text[shown:], "append"
+        from chat_render import render_chat
+
+        return render_chat(chat_file, os.path.dirname(stream_file)), "replace"
+
+    def read_stream(
+        self, stream_file, chat_file, pid_stream_file, stream_state_file, stream_marker
+    ):
+        cursor_file = self.cursor_path(stream_file)
+        if stream_marker:
+            if self.stream_deltas:
+                delete_file(cursor_file)
+            return json_codec.dumps(
                 {
-                    "rerun": 0.1,
+                    "rerun": rerun_bounds()[0],
                     "variables": {"streaming_now": True},
-                    "response": assistant_signature() + response_text,
-                    "behaviour": {"response": "replacelast"},
-                }
+                    "response": f"{assistant_signature()}...",
+                    "behaviour": {"response": "append"},
+                },
+                ensure_ascii=False,
             )
 
-        append_chat(
-            chat_file,
-            {"role": "assistant", "content": response_text or error_message or ""},
+        state, response_text, error_message, status, idle = self.poll_stream(
+            stream_file, stream_state_file
         )
-        delete_file(stream_file)
-        delete_file(pid_stream_file)
 
-        footer_text = ""
-        if error_message:
-            response_text = f"{response_text} [Error: {error_message}]"
-            footer_text = f"[{error_message}]"
+        if status == "waiting":
+            return json_codec.dumps(
+                {
+                    "rerun": next_interval(state, idle),
+                    "variables": {"streaming_now": True},
+                }
+            )
 
-        return json.dumps(
-            {
+        if status == "streaming":
+            output = {
+                "rerun": next_interval(state, idle),
+                "variables": {"streaming_now": True},
                 "response": assistant_signature() + response_text,
-                "footer": footer_text,
-                "behaviour": {"response": "replacelast", "scroll": "end"},
+                "behaviour": {"response": "replacelast"},
             }
+            if self.stream_deltas:
+                response, behaviour = self.delta_output(
+                    self.read_cursor(cursor_file), response_text, stream_file, chat_file
+                )
+                if behaviour == "replace":
+                    # 对话中还没有这条回答，接在重绘的对话之后
+                    response += assistant_signature() + response_text
+                self.write_cursor(cursor_file, response_text)
+                del output["response"], output["behaviour"]
+                if response:
+                    output["response"] = response
+                    output["behaviour"] = {"response": behaviour}
+            return json_codec.dumps(output, ensure_ascii=False)
+
+        response_text, footer_text = self.commit_stream(
+            chat_file,
+            stream_file,
+            pid_stream_file,
+            stream_state_file,
+            state,
+            response_text,
+            error_message,
+            status,
         )
+        output = {
+            "response": assistant_signature() + response_text,
+            "footer": footer_text,
+            "behaviour": {"response": "replacelast", "scroll": "end"},
+        }
+        if self.stream_deltas:
+            # 收尾时同样只追加剩余部分；replacelast 只会替换最后一次追加的片段
+            cursor = self.read_cursor(cursor_file)
+            delete_file(cursor_file)
+            if cursor is not None:
+                response, behaviour = self.delta_output(
+                    cursor, response_text, stream_file, chat_file
+                )
+                output["response"] = response
+                output["behaviour"] = {"response": behaviour, "scroll": "end"}
+        return json_codec.dumps(output, ensure_ascii=False)
@@ -0,0 +1,89 @@
+"""
+每次请求的耗时与吞吐记录，逐行追加到 alfred_workflow_cache/metrics.jsonl，由 stats.py 汇总。
+
+时间点记录在流的解析状态中：started 在发起请求时写入，first_byte / first_token / last_token
+在 read_stream 每次 rerun 观察到变化时写入，因此精度受 rerun 间隔限制。
+token 数按 context_window 的字符估算得出，各服务商一致，便于横向比较。
+服务商在流中返回 usage 时，另外记录输入 token 数与其中命中提示词缓存的部分（input_tokens / cached_tokens）。
+"""
+
+import os
+
+import json_codec
+
+MAX_RECORDS = 5000
+
+
+def metrics_path(cache_dir):
+    return os.path.join(cache_dir, "metrics.jsonl")
+
+
+def mark_progress(state, received, text, now):
+    """在解析状态中记录首字节、首个 token 与最后一次输出的时间"""
+    if received > 0 and "first_byte" not in state:
+        state["first_byte"] = now
+    state["bytes"] = received
+    if len(text) > state.get("chars", 0):
+        state.setdefault("first_token", now)
+        state["last_token"] = now
+        state["chars"] = len(text)
+
+
+def build_record(provider, model, state, text, status, error, now):
+    from context_window import estimate_chars
+
+    started = state.get("started", now)
+    first_token = state.get("first_token")
+    last_token = state.get("last_token")
+    tokens = estimate_chars(text) if text else 0
+    record = {
+        "ts": round(now, 3),
+        "provider": provider,
+        "model": model,
+        "status": "error" if error else status,
+        "cache": state.get("cache", ""),
+        "daemon": bool(state.get("daemon")),
+        "bytes": state.get("bytes", 0),
+        "tokens": tokens,
+        "duration": round(now - started, 3),
+        "ttfb": None,
+        "ttft": None,
+        "tps": None,
+        "input_tokens": state.get("input_tokens"),
+        "cached_tokens": state.get("cached_tokens"),
+    }
+    if "first_byte" in state:
+        record["ttfb"] = round(state["first_byte"] - started, 3)
+    if first_token is not None:
+        record["ttft"] = round(first_token - started, 3)
+        if last_token > first_token:
+            record["tps"] = round(tokens / (last_token - first_token), 1)
+    return record
+
+
+def append_record(cache_dir, record):
+    path = metrics_path(cache_dir)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json_codec.dumps(record) + "\n")
+        size = file.tell()
+    # 文件过大时只保留最近的记录
+    if size > MAX_RECORDS * 400:
+        records = read_records(cache_dir)[-MAX_RECORDS // 2 :]
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write("".join(json_codec.dumps(record) + "\n" for record in records))
+        os.replace(temp_path, path)
+
+
+def read_records(cache_dir):
+    path = metrics_path(cache_dir)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                records.append(json_codec.loads(line))
+            except ValueError:
+                continue
+    return records
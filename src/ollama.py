@@ -1,58 +1,43 @@
-import json
-from typing import Optional
-
 from llm_service import LLMService
 
 
 class OllamaService(LLMService):
+    framing = "ndjson"
+
     def __init__(self, api_endpoint, model, http_proxy, socks5_proxy):
         super().__init__(api_endpoint, "", model, http_proxy, socks5_proxy)
 
-    def construct_curl_command(self, max_tokens, messages, stream_file):
+    def build_request(self, max_tokens, messages, system_prompt=None):
+        messages = self.with_system_message(messages, system_prompt)
         data = {
             "model": self.model,
             "messages": messages,
             "stream": True,
             "options": {"num_predict": max_tokens},
         }
-
-        return [
-            "curl",
-            f"{self.api_endpoint}/api/chat",
-            "--speed-limit",
-            "0",
-            "--speed-time",
-            str(self.stall_timeout_sec),  # Abort stalled connection after a few seconds
-            "--silent",
-            "--no-buffer",
-            "--header",
-            "Content-Type: application/json",
-            "--data",
-            json.dumps(data),
-            "--output",
-            stream_file,
-        ] + self.proxy_option
-
-    def parse_stream_response(self, stream_string) -> tuple[str, Optional[str], bool]:
-        response_text = ""
-        has_stopped = False
-
-        for line in stream_string.split("\n"):
-            if not line.strip():
-                continue
-            try:
-                chunk = json.loads(line)
-            except json.JSONDecodeError:
-                # 忽略不完整分片，避免误报
-                continue
-
-            # 统一错误呈现：Ollama 在失败时可能返回 {"error": "..."}
-            if "error" in chunk and chunk["error"]:
-                return str(chunk["error"]), "", True
-
-            if "message" in chunk:
-                response_text += chunk["message"].get("content", "")
-            if "done" in chunk and chunk["done"]:
-                has_stopped = True
-
-        return response_text, None, has_stopped
+        headers = {"Content-Type": "application/json"}
+        return f"{self.api_endpoint}/api/chat", headers, data
+
+    def is_error_body(self, head) -> bool:
+        # NDJSON 的每一行都以 { 开头，错误同样以单行 JSON 的形式出现在流中
+        return False
+
+    def handle_event(self, state, event, payload, pieces):
+        if not isinstance(payload, dict):
+            return False
+        # 统一错误呈现：Ollama 在失败时可能返回 {"error": "..."}
+        if payload.get("error"):
+            pieces.clear()
+            state["failed"] = True
+            state["text"], state["error"], state["stopped"] = (
+                str(payload["error"]),
+                "",
+                True,
+            )
+            return True
+
+        if "message" in payload:
+            pieces.append(payload["message"].get("content", ""))
+        if payload.get("done"):
+            state["stopped"] = True
+        return False
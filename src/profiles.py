@@ -1,17 +1,14 @@
 #!/usr/bin/env python3
 
-import json
+import json_codec
 from helper import env_var
+from providers import PROVIDERS
 
 
 def provider_items():
     providers = [
-        ("openai", "OpenAI", env_var("openai_model")),
-        ("anthropic", "Anthropic", env_var("anthropic_model")),
-        ("gemini", "Gemini", env_var("gemini_model")),
-        ("qwen", "Qwen", env_var("qwen_model")),
-        ("ollama", "Ollama", env_var("ollama_model")),
-        ("deepseek", "DeepSeek", env_var("deepseek_model")),
+        (key, provider["label"], env_var(f"{key}_model"))
+        for key, provider in PROVIDERS.items()
     ]
 
     current = env_var("selected_llm_service") or ""
@@ -33,7 +30,7 @@ def provider_items():
 
 def main():
     data = {"items": provider_items()}
-    print(json.dumps(data))
+    print(json_codec.dumps(data))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+import importlib
+
+from helper import env_var
+
+# 服务商注册表：只有被选中的服务商模块才会被导入
+PROVIDERS = {
+    "openai": {"module": "openai", "class": "OpenaiService", "label": "OpenAI"},
+    "anthropic": {
+        "module": "anthropic",
+        "class": "AnthropicService",
+        "label": "Anthropic",
+    },
+    "gemini": {"module": "gemini", "class": "GeminiService", "label": "Gemini"},
+    "qwen": {"module": "qwen", "class": "QwenService", "label": "Qwen"},
+    "ollama": {
+        "module": "ollama",
+        "class": "OllamaService",
+        "label": "Ollama",
+        "api_key": False,
+    },
+    "deepseek": {"module": "deepseek", "class": "DeepseekService", "label": "DeepSeek"},
+    "chatglm": {"module": "chatglm", "class": "ChatGLMService", "label": "ChatGLM"},
+}
+
+
+def load_service(key, http_proxy, socks5_proxy):
+    """导入并构造 key 对应的 LLMService；只读取该服务商自己的配置"""
+    provider = PROVIDERS.get(key)
+    if provider is None:
+        return None
+
+    module = importlib.import_module(provider["module"])
+    service_class = getattr(module, provider["class"])
+
+    api_endpoint = env_var(f"{key}_api_endpoint")
+    model = env_var(f"{key}_model")
+    if not provider.get("api_key", True):
+        return service_class(api_endpoint, model, http_proxy, socks5_proxy)
+    return service_class(
+        api_endpoint, env_var(f"{key}_api_key"), model, http_proxy, socks5_proxy
+    )
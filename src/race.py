@@ -0,0 +1,143 @@
+"""
+竞速模式：同一个请求同时发给当前服务商与 race_fallbacks 中的备选服务商，最先输出有效内容的胜出。
+
+复用 fanout.py 的文件布局与启动方式。胜者确定后立即按 pid 终止其余请求，此后只读取胜者的流；
+只有胜者的回答会写入对话，footer 中记录胜者与首个 token 的到达时间。
+所有服务商都在输出内容前失败时，按当前服务商的结果（错误或卡顿）收尾。
+"""
+
+import time
+
+import json_codec
+from fanout import progress_path, read_pids, service_files
+from helper import assistant_signature, delete_file, env_var, write_file
+from providers import PROVIDERS, load_service
+from rerun_schedule import next_interval, rerun_bounds
+
+
+def race_services(primary):
+    """返回 [当前服务商, 备选服务商...]；没有可用的备选时不启用竞速"""
+    keys = [primary] + [key.strip() for key in env_var("race_fallbacks").split(",")]
+    keys = [key for key in dict.fromkeys(keys) if key in PROVIDERS]
+    return keys if len(keys) > 1 else []
+
+
+def race_footer(progress, footer=""):
+    label = PROVIDERS[progress["winner"]]["label"]
+    parts = [f"{label} won · first token {progress['ttft']}s"]
+    if footer:
+        parts.append(footer)
+    return " · ".join(parts)
+
+
+def finish_race(cache_dir, stream_file, pid_stream_file):
+    delete_file(stream_file)
+    delete_file(pid_stream_file)
+    delete_file(progress_path(cache_dir))
+
+
+def read_race(
+    cache_dir,
+    chat_file,
+    stream_file,
+    pid_stream_file,
+    stream_marker,
+    http_proxy,
+    socks5_proxy,
+):
+    with open(progress_path(cache_dir), "r", encoding="utf-8") as file:
+        progress = json_codec.loads(file.read())
+    keys = progress["services"]
+
+    if stream_marker:
+        return json_codec.dumps(
+            {
+                "rerun": rerun_bounds()[0],
+                "variables": {"streaming_now": True},
+                "response": f"{assistant_signature()}...",
+                "behaviour": {"response": "append"},
+            },
+            ensure_ascii=False,
+        )
+
+    if progress.get("winner") is None:
+        reruns = []
+        lost = progress.setdefault("lost", [])
+        for key in keys:
+            if key in lost:
+                continue
+            service = load_service(key, http_proxy, socks5_proxy)
+            key_stream_file, _, key_state_file = service_files(cache_dir, key)
+            state, text, error, status, idle = service.poll_stream(
+                key_stream_file, key_state_file
+            )
+            # 错误体与流中的错误事件以正文的形式返回（error 为空），由 failed 区分
+            failed = bool(error) or state.get("failed", False)
+            if text and not failed and status in ("streaming", "stopped"):
+                # 按配置顺序检查，同一轮中有多个服务商出字时优先当前服务商
+                progress["winner"] = key
+                progress["ttft"] = round(time.time() - progress["started"], 2)
+                break
+            if status == "waiting" or (status == "streaming" and not failed):
+                reruns.append(next_interval(state, idle))
+            else:
+                # 在输出有效内容前就出错或卡顿，退出竞速，但保留结果以备全部失败时展示
+                lost.append(key)
+
+        if progress.get("winner") is None and reruns:
+            write_file(progress_path(cache_dir), json_codec.dumps(progress))
+            return json_codec.dumps(
+                {"rerun": min(reruns), "variables": {"streaming_now": True}}
+            )
+
+        if progress.get("winner") is None:
+            progress["winner"] = keys[0]
+            progress["ttft"] = round(time.time() - progress["started"], 2)
+
+        for key in keys:
+            if key != progress["winner"]:
+                loser = load_service(key, http_proxy, socks5_proxy)
+                loser.cancel_stream(*service_files(cache_dir, key))
+        write_file(pid_stream_file, read_pids(cache_dir, [progress["winner"]]))
+        write_file(progress_path(cache_dir), json_codec.dumps(progress))
+
+    key = progress["winner"]
+    label = PROVIDERS[key]["label"]
+    service = load_service(key, http_proxy, socks5_proxy)
+    key_stream_file, key_pid_file, key_state_file = service_files(cache_dir, key)
+    state, text, error, status, idle = service.poll_stream(
+        key_stream_file, key_state_file
+    )
+
+    if status in ("waiting", "streaming"):
+        return json_codec.dumps(
+            {
+                "rerun": next_interval(state, idle),
+                "variables": {"streaming_now": True},
+                "response": assistant_signature(label) + text,
+                "footer": race_footer(progress),
+                "behaviour": {"response": "replacelast"},
+            },
+            ensure_ascii=False,
+        )
+
+    response, footer = service.commit_stream(
+        chat_file,
+        key_stream_file,
+        key_pid_file,
+        key_state_file,
+        state,
+        text,
+        error,
+        status,
+        label,
+    )
+    finish_race(cache_dir, stream_file, pid_stream_file)
+    return json_codec.dumps(
+        {
+            "response": assistant_signature(label) + response,
+            "footer": race_footer(progress, footer),
+            "behaviour": {"response": "replacelast", "scroll": "end"},
+        },
+        ensure_ascii=False,
+    )
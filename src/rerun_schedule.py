@@ -0,0 +1,69 @@
+"""
+根据流的到达速率自适应地选择下一次 rerun 的间隔。
+
+Alfred 的 rerun 取值范围是 0.1～5 秒。本次读到新字节时按下限（默认 0.1 秒）尽快再读；
+没有新字节时按到达速率估计下一批 TARGET_BYTES 个原始字节到达所需的时间，
+长时间没有新内容（例如模型在思考）时按距最后一次写入的时间逐步放慢，减少空转启动的 Python 进程。
+间隔上下限可通过 rerun_min_sec / rerun_max_sec 配置；打开 Alfred 调试器时会把选择的间隔输出到 stderr。
+"""
+
+import sys
+
+from helper import env_var
+
+MIN_RERUN_SEC = 0.1
+MAX_RERUN_SEC = 5.0
+DEFAULT_MAX_SEC = 1.0
+TARGET_BYTES = 256
+BACKOFF = 0.5
+SMOOTHING = 0.5
+
+
+def parse_seconds(value, default):
+    try:
+        return min(MAX_RERUN_SEC, max(MIN_RERUN_SEC, float(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def rerun_bounds():
+    low = parse_seconds(env_var("rerun_min_sec"), MIN_RERUN_SEC)
+    high = parse_seconds(env_var("rerun_max_sec"), DEFAULT_MAX_SEC)
+    return low, max(low, high)
+
+
+def observe(state, received, now):
+    """记录已收到的总字节数与本次是否读到新字节，并用指数平滑更新到达速率（字节/秒）"""
+    growth = received - state.get("received", 0)
+    state["grew"] = growth > 0
+    if growth <= 0:
+        return
+    # 首批字节从发出请求时算起；解析状态被重建而没有 started 时才退回一个最短间隔
+    since = state.get("seen", state.get("started", now - MIN_RERUN_SEC))
+    elapsed = max(0.01, now - since)
+    rate = growth / elapsed
+    previous = state.get("rate")
+    if previous is not None:
+        rate = SMOOTHING * rate + (1 - SMOOTHING) * previous
+    state["rate"] = rate
+    state["received"] = received
+    state["seen"] = now
+
+
+def next_interval(state, idle, bounds=None):
+    low, high = bounds or rerun_bounds()
+    rate = state.get("rate")
+    if state.get("grew"):
+        interval = low
+    else:
+        interval = TARGET_BYTES / rate if rate else low
+        # 距最后一次写入越久越可能仍在等待，逐步退避
+        interval = max(interval, idle * BACKOFF)
+    interval = round(min(high, max(low, interval)), 2)
+    debug(f"rerun {interval}s (rate {rate or 0:.0f} B/s, idle {idle:.2f}s)")
+    return interval
+
+
+def debug(message):
+    if env_var("alfred_debug") == "1":
+        print(message, file=sys.stderr)
@@ -0,0 +1,88 @@
+"""
+可选的响应缓存：相同的请求（服务商、模型、系统提示词、上下文、max_tokens 完全一致）直接回放上次的流。
+
+以 build_request 生成的 url 与序列化后请求体的哈希为键，把完整的原始流字节保存在
+alfred_workflow_cache/response_cache 下；回放时写回 stream_file，仍由 read_stream 正常解析。
+条目超过 TTL 即失效，总大小或条数超限时按最近使用时间淘汰。
+"""
+
+import hashlib
+import os
+import time
+
+import json_codec
+from helper import delete_file, env_var, file_exists, make_dir, write_file
+
+DEFAULT_TTL_SEC = 86400
+MAX_ENTRIES = 200
+MAX_BYTES = 16 * 1024 * 1024
+
+
+def cache_ttl():
+    try:
+        return max(0, int(env_var("response_cache_ttl") or DEFAULT_TTL_SEC))
+    except ValueError:
+        return DEFAULT_TTL_SEC
+
+
+def request_key(url, body):
+    return hashlib.sha256(f"{url}\n{body}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_dir, ttl_sec=None):
+        self.cache_dir = os.path.join(cache_dir, "response_cache")
+        self.index_file = os.path.join(self.cache_dir, "index.json")
+        self.ttl_sec = cache_ttl() if ttl_sec is None else ttl_sec
+        self.entries = {}
+        if file_exists(self.index_file):
+            with open(self.index_file, "r", encoding="utf-8") as file:
+                self.entries = json_codec.loads(file.read())
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.stream")
+
+    def save(self):
+        make_dir(self.cache_dir)
+        write_file(self.index_file, json_codec.dumps(self.entries))
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+        delete_file(self.entry_path(key))
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        path = self.entry_path(key)
+        if now - entry["created"] > self.ttl_sec or not file_exists(path):
+            self.remove(key)
+            self.save()
+            return None
+        with open(path, "rb") as file:
+            data = file.read()
+        entry["used"] = now
+        self.save()
+        return data
+
+    def put(self, key, data):
+        make_dir(self.cache_dir)
+        with open(self.entry_path(key), "wb") as file:
+            file.write(data)
+        now = time.time()
+        self.entries[key] = {"created": now, "used": now, "size": len(data)}
+
+        # 先清理过期条目，再按最近使用时间从旧到新淘汰
+        for old_key, entry in list(self.entries.items()):
+            if now - entry["created"] > self.ttl_sec:
+                self.remove(old_key)
+        total = sum(entry["size"] for entry in self.entries.values())
+        for old_key, entry in sorted(self.entries.items(), key=lambda item: item[1]["used"]):
+            if len(self.entries) <= MAX_ENTRIES and total <= MAX_BYTES:
+                break
+            if old_key == key:
+                continue
+            total -= entry["size"]
+            self.remove(old_key)
+        self.save()
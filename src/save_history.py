@@ -3,7 +3,12 @@
 import os
 from datetime import datetime
 
-from helper import env_var, make_dir, mv, write_file
+from archive_store import pack_if_needed
+from chat_store import compact_chat, move_chat, reset_chat
+from context_summary import summary_path
+from helper import delete_file, env_var, make_dir
+from history_index import remove_entry, update_entry
+from search_index import rename
 
 
 def pad_date(number):
@@ -30,12 +35,23 @@ def run():
     archived_chat = f"{archive_dir}/{current_year}.{current_month}.{current_day}.{current_hour}.{current_minute}.{current_second}-{uid}.json"
 
     make_dir(archive_dir)
-    mv(current_chat, archived_chat)
+    # 归档前整理一次：把旧格式转换为 JSON Lines 并去掉写入中断留下的残缺行
+    compact_chat(current_chat)
+    move_chat(current_chat, archived_chat)
+    # 摘要只对应当前对话
+    delete_file(summary_path(current_chat))
+    update_entry(env_var("alfred_workflow_data"), archived_chat)
+    rename(env_var("alfred_workflow_data"), current_chat, archived_chat)
 
     if replacement_chat:
-        mv(replacement_chat, current_chat)
+        # 恢复的对话可能已打包进段文件或保存在 SQLite 存储中
+        move_chat(replacement_chat, current_chat)
+        remove_entry(env_var("alfred_workflow_data"), os.path.basename(replacement_chat))
+        rename(env_var("alfred_workflow_data"), replacement_chat, current_chat)
     else:
-        write_file(current_chat, "[]")
+        reset_chat(current_chat)
+
+    pack_if_needed(archive_dir)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""
+对话全文检索：search.db（SQLite FTS5，porter + unicode61 分词）索引归档与当前对话中的每条消息。
+
+首次搜索时全量建立索引；之后 append_chat 只插入新消息，归档/恢复对话时只改名，
+其余变化（例如在工作流之外修改了文件）按 mtime/size 增量同步。
+"""
+
+import os
+import sqlite3
+
+from chat_store import read_chat, stat_chat
+from history_index import chat_files
+
+# 消息保存在普通表中（按 name 建索引，便于整文件删除/改名），FTS5 表以其为外部内容
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY, mtime REAL, size INTEGER, count INTEGER
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY, name TEXT, seq INTEGER, role TEXT, content TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_name ON messages (name);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content = 'messages', content_rowid = 'id',
+    tokenize = 'porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content)
+    VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def db_path(data_dir):
+    return os.path.join(data_dir, "search.db")
+
+
+def connect(data_dir):
+    conn = sqlite3.connect(db_path(data_dir))
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def index_file(conn, name, path, stat):
+    messages = read_chat(path)
+    conn.execute("DELETE FROM messages WHERE name = ?", (name,))
+    conn.executemany(
+        "INSERT INTO messages (content, name, seq, role) VALUES (?, ?, ?, ?)",
+        [
+            (message.get("content") or "", name, seq, message.get("role"))
+            for seq, message in enumerate(messages)
+        ],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+        (name, stat.st_mtime, stat.st_size, len(messages)),
+    )
+
+
+def sync(data_dir):
+    """重新索引新增或 mtime/size 变化的文件，删除已不存在文件的消息；返回连接"""
+    conn = connect(data_dir)
+    with conn:
+        known = {
+            name: (mtime, size)
+            for name, mtime, size in conn.execute("SELECT name, mtime, size FROM files")
+        }
+        seen = set()
+        for path, stat in chat_files(data_dir):
+            name = os.path.relpath(path, data_dir)
+            seen.add(name)
+            if known.get(name) != (stat.st_mtime, stat.st_size):
+                index_file(conn, name, path, stat)
+        for name in set(known) - seen:
+            conn.execute("DELETE FROM messages WHERE name = ?", (name,))
+            conn.execute("DELETE FROM files WHERE name = ?", (name,))
+    return conn
+
+
+def on_append(path, message):
+    """append_chat 之后调用：只插入这一条消息。尚未建立索引时什么也不做"""
+    data_dir = os.path.dirname(path)
+    if not os.path.exists(db_path(data_dir)):
+        return
+    name = os.path.basename(path)
+    try:
+        conn = connect(data_dir)
+        with conn:
+            row = conn.execute(
+                "SELECT count FROM files WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return
+            conn.execute(
+                "INSERT INTO messages (content, name, seq, role) VALUES (?, ?, ?, ?)",
+                (message.get("content") or "", name, row[0], message.get("role")),
+            )
+            stat = stat_chat(path)
+            conn.execute(
+                "UPDATE files SET mtime = ?, size = ?, count = ? WHERE name = ?",
+                (stat.st_mtime, stat.st_size, row[0] + 1, name),
+            )
+        conn.close()
+    except sqlite3.Error:
+        # 索引只是加速手段，出错时交给下次 sync 修复
+        pass
+
+
+def rename(data_dir, old_path, new_path):
+    """归档或恢复对话时文件只是换了位置，消息无需重新索引"""
+    if not os.path.exists(db_path(data_dir)):
+        return
+    old_name = os.path.relpath(old_path, data_dir)
+    new_name = os.path.relpath(new_path, data_dir)
+    try:
+        conn = connect(data_dir)
+        with conn:
+            for table in ("messages", "files"):
+                conn.execute(f"DELETE FROM {table} WHERE name = ?", (new_name,))
+                conn.execute(
+                    f"UPDATE {table} SET name = ? WHERE name = ?",
+                    (new_name, old_name),
+                )
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def match_expression(query):
+    # 每个词按前缀匹配；加引号避免用户输入被当作 FTS5 语法
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in query.split())
+
+
+def search(conn, query, limit=40):
+    """按 bm25 相关度返回 [(name, seq, role, snippet)]"""
+    return conn.execute(
+        "SELECT m.name, m.seq, m.role, snippet(messages_fts, 0, '', '', '…', 12) "
+        "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+        "WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+        (match_expression(query), limit),
+    ).fetchall()
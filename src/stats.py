@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Script Filter：按服务商与模型汇总 metrics.jsonl 中的首 token 延迟（TTFT）与吞吐，p50/p95。
+缓存命中的回放不计入统计；可输入服务商或模型名过滤。
+服务商返回了 usage 时，一并显示输入 token 中命中提示词缓存的比例。
+"""
+
+import math
+import sys
+
+import json_codec
+from helper import env_var
+from metrics import read_records
+from providers import PROVIDERS
+
+
+def percentile(values, fraction):
+    """最近秩法；values 需已排序"""
+    if not values:
+        return None
+    index = max(0, math.ceil(fraction * len(values)) - 1)
+    return values[index]
+
+
+def format_seconds(value):
+    return "–" if value is None else f"{value:.2f}s"
+
+
+def format_rate(value):
+    return "–" if value is None else f"{value:.0f} tok/s"
+
+
+def summarize(records):
+    groups = {}
+    for record in records:
+        if record.get("cache") == "hit":
+            continue
+        key = (record.get("provider") or "", record.get("model") or "")
+        groups.setdefault(key, []).append(record)
+
+    rows = []
+    for (provider, model), group in groups.items():
+        ttft = sorted(r["ttft"] for r in group if r.get("ttft") is not None)
+        tps = sorted(r["tps"] for r in group if r.get("tps") is not None)
+        failed = sum(1 for r in group if r.get("status") != "stopped")
+        input_tokens = sum(r.get("input_tokens") or 0 for r in group)
+        cached_tokens = sum(r.get("cached_tokens") or 0 for r in group)
+        rows.append(
+            {
+                "provider": provider,
+                "model": model,
+                "count": len(group),
+                "failed": failed,
+                "ttft_p50": percentile(ttft, 0.5),
+                "ttft_p95": percentile(ttft, 0.95),
+                "tps_p50": percentile(tps, 0.5),
+                "tps_p95": percentile(tps, 0.95),
+                "prompt_cached": cached_tokens / input_tokens if input_tokens else None,
+            }
+        )
+    # TTFT 中位数越小越靠前，没有数据的排在最后
+    rows.sort(key=lambda row: (row["ttft_p50"] is None, row["ttft_p50"] or 0))
+    return rows
+
+
+def run(argv):
+    query = argv[0].strip().lower() if argv else ""
+    rows = summarize(read_records(env_var("alfred_workflow_cache")))
+    if query:
+        rows = [
+            row
+            for row in rows
+            if query in row["provider"].lower() or query in row["model"].lower()
+        ]
+
+    items = []
+    for row in rows:
+        label = PROVIDERS.get(row["provider"], {}).get("label", row["provider"])
+        title = (
+            f"{label} · {row['model']}    "
+            f"TTFT p50 {format_seconds(row['ttft_p50'])}"
+            f" / p95 {format_seconds(row['ttft_p95'])}"
+        )
+        subtitle = (
+            f"{format_rate(row['tps_p50'])} median, {format_rate(row['tps_p95'])} p95 · "
+            f"{row['count']} requests, {row['failed']} failed or stalled"
+        )
+        if row["prompt_cached"] is not None:
+            subtitle += f" · {row['prompt_cached']:.0%} of input tokens cached"
+        summary = f"{title}\n{subtitle}"
+        items.append(
+            {
+                "uid": f"{row['provider']}/{row['model']}",
+                "title": title,
+                "subtitle": subtitle,
+                "valid": False,
+                "text": {"copy": summary, "largetype": summary},
+            }
+        )
+
+    if not items:
+        items.append(
+            {
+                "title": "No Request Metrics Yet",
+                "subtitle": "Timings are recorded for every answered question",
+                "valid": False,
+            }
+        )
+    return json_codec.dumps({"items": items})
+
+
+if __name__ == "__main__":
+    print(run(sys.argv[1:]))
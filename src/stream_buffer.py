@@ -0,0 +1,97 @@
+"""
+守护进程写入响应流的内存映射缓冲区。
+
+文件由固定 32 字节的头部与数据区组成，头部记录：魔数、版本、已写入的字节数、
+最后一次写入的时间，以及连接是否已结束。写入端（stream_daemon.py）按需倍增数据区；
+读取端（每次 rerun）映射文件后只切出 offset 之后的新字节，无需经 socket 向守护进程询问，
+也不必读取整个文件。被截断的 UTF-8 字符与未完成的行仍由 advance_stream_state 留到下次解析。
+"""
+
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b"CHSB"
+VERSION = 1
+# 魔数、版本、已写入字节数、最后写入时间、是否已结束
+HEADER = struct.Struct("<4sIQdI")
+HEADER_SIZE = 32
+INITIAL_CAPACITY = 256 * 1024
+
+
+class StreamBuffer:
+    def __init__(self, path, capacity=INITIAL_CAPACITY):
+        # 先在新 inode 上初始化再替换，读取端看到的要么是旧文件，要么是完整的头部
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        self.fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.capacity = capacity
+        os.ftruncate(self.fd, HEADER_SIZE + capacity)
+        self.map = mmap.mmap(self.fd, HEADER_SIZE + capacity)
+        self.length = 0
+        self.updated = time.time()
+        self.done = False
+        self.publish()
+        os.replace(temp_path, path)
+
+    def publish(self):
+        HEADER.pack_into(
+            self.map, 0, MAGIC, VERSION, self.length, self.updated, int(self.done)
+        )
+
+    def grow(self, needed):
+        self.map.close()
+        self.capacity = max(self.capacity * 2, needed)
+        os.ftruncate(self.fd, HEADER_SIZE + self.capacity)
+        self.map = mmap.mmap(self.fd, HEADER_SIZE + self.capacity)
+
+    def write(self, data):
+        end = self.length + len(data)
+        if end > self.capacity:
+            self.grow(end)
+        # 先写数据再更新头部中的长度
+        self.map[HEADER_SIZE + self.length : HEADER_SIZE + end] = data
+        self.length = end
+        self.updated = time.time()
+        self.publish()
+
+    def finish(self):
+        # 不更新写入时间：连接异常结束时读取端仍按卡顿处理
+        self.done = True
+        self.publish()
+
+    def read(self, offset):
+        return self.map[HEADER_SIZE + offset : HEADER_SIZE + self.length]
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+def read_buffer(path, offset):
+    """
+    返回 (offset 之后的新字节, 已写入的总字节数, 距最后一次写入的秒数, 连接是否已结束)；
+    path 不存在或不是缓冲区文件时返回 None。
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        size = os.fstat(fd).st_size
+        if size < HEADER_SIZE:
+            return None
+        with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as view:
+            magic, version, length, updated, done = HEADER.unpack_from(view)
+            if magic != MAGIC or version != VERSION:
+                return None
+            data = view[HEADER_SIZE + offset : min(HEADER_SIZE + length, size)]
+    finally:
+        os.close(fd)
+
+    # 写入端先写数据后更新长度，但跨进程的内存可见顺序没有保证；响应流中不会出现 NUL，
+    # 读到尚未可见的零字节时截断，留到下一次再读
+    zero = data.find(b"\0")
+    if zero >= 0:
+        data, done = data[:zero], False
+    return data, offset + len(data), time.time() - updated, bool(done)
@@ -0,0 +1,58 @@
+"""
+stream_daemon.py 的轻量客户端。rerun 时只会导入本模块，避免加载 asyncio/ssl。
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import json_codec
+
+
+def socket_path():
+    # macOS 的 Unix socket 路径上限约 104 字节，Alfred 的缓存目录太长，放在用户临时目录下
+    return os.path.join(tempfile.gettempdir(), f"alfred-chathub-{os.getuid()}.sock")
+
+
+def send_command(command, timeout=2):
+    """返回 (回复头, 数据)；连接失败时抛出 OSError，回复不完整或无法解析时抛出 ValueError"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path())
+        sock.sendall(json_codec.dumps(command).encode("utf-8") + b"\n")
+        reply = sock.makefile("rb")
+        header = json_codec.loads(reply.readline())
+        size = header.get("size", 0)
+        data = reply.read(size) if size else b""
+    return header, data
+
+
+def ensure_daemon(wait_sec=1.0):
+    """确认守护进程可用，必要时在后台启动它；失败返回 False，由调用方回退到 curl"""
+    try:
+        send_command({"cmd": "ping"})
+        return True
+    except (OSError, ValueError):
+        pass
+
+    daemon_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stream_daemon.py")
+    with open(os.devnull, "w") as devnull:
+        subprocess.Popen(
+            [sys.executable, daemon_script, socket_path()],
+            stdout=devnull,
+            stderr=devnull,
+            start_new_session=True,
+        )
+
+    deadline = time.time() + wait_sec
+    while time.time() < deadline:
+        time.sleep(0.02)
+        try:
+            send_command({"cmd": "ping"})
+            return True
+        except (OSError, ValueError):
+            continue
+    return False
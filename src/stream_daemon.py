@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""
+常驻的本地流式守护进程（可选）。
+
+每次提问都启动一个 curl 会重新做 TCP/TLS 握手；守护进程在一个 asyncio 事件循环中发起请求
+（见 http_engine.py），按 (scheme, host, port, proxy) 保留 keep-alive 连接，
+把各请求的响应字节写入 stream_file 处的内存映射缓冲区（见 stream_buffer.py），
+chat.py 每次 rerun 直接映射读取“游标 N 之后的新字节”；也可以通过 Unix socket 询问
+（客户端见 stream_client.py）。
+
+协议：客户端发送一行 JSON 命令；服务端先回复一行 JSON 头，read 命令的头之后紧跟 size 个原始字节。
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import json_codec
+from http_engine import make_engine
+from stream_buffer import StreamBuffer
+
+IDLE_EXIT_SEC = 600
+RELEASE_AFTER_SEC = 600
+# 一行命令的长度上限；start 命令带着整个请求体，StreamReader 默认的 64 KiB 放不下长对话
+COMMAND_LIMIT = 64 * 1024 * 1024
+
+
+class Stream:
+    def __init__(self, marker):
+        self.marker = marker
+        self.buffer = StreamBuffer(marker)
+        self.done = False
+        self.last_growth = time.time()
+
+
+class StreamDaemon:
+    def __init__(self, engine):
+        self.engine = engine
+        self.streams = {}
+        self.tasks = set()
+        self.last_activity = time.time()
+
+    async def run_stream(self, stream_id, stream, command):
+        def write(data):
+            stream.buffer.write(data)
+            stream.last_growth = time.time()
+            # 流文件被删除（用户中断了回答）时放弃该连接
+            return os.path.exists(stream.marker)
+
+        try:
+            await self.engine.stream(command, write, command["stall_timeout"])
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError):
+            # 连接失败或超过 stall_timeout 无数据；保持 last_growth 不变，由客户端按卡顿处理
+            pass
+        finally:
+            stream.done = True
+            stream.buffer.finish()
+            if self.streams.get(stream_id) is not stream:
+                # 读取端已经释放了该请求
+                stream.buffer.close()
+
+    def start(self, command):
+        try:
+            stream = Stream(command["marker"])
+        except OSError:
+            return {"ok": False}
+        self.streams[command["id"]] = stream
+        task = asyncio.ensure_future(self.run_stream(command["id"], stream, command))
+        # 保留任务的引用，避免运行中被回收
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return {"ok": True}
+
+    def read(self, command):
+        stream = self.streams.get(command["id"])
+        if stream is None:
+            return {"ok": False}, b""
+        data = stream.buffer.read(command["cursor"])
+        header = {
+            "ok": True,
+            "size": len(data),
+            "received": stream.buffer.length,
+            "idle": time.time() - stream.last_growth,
+            "done": stream.done,
+        }
+        return header, data
+
+    def release(self, command):
+        stream = self.streams.pop(command["id"], None)
+        if stream is not None and stream.done:
+            stream.buffer.close()
+        return {"ok": True}
+
+    def collect(self):
+        now = time.time()
+        for stream_id, stream in list(self.streams.items()):
+            if stream.done and now - stream.last_growth > RELEASE_AFTER_SEC:
+                del self.streams[stream_id]
+                stream.buffer.close()
+        busy = any(not stream.done for stream in self.streams.values())
+        if busy:
+            self.last_activity = now
+        return now - self.last_activity > IDLE_EXIT_SEC
+
+    async def handle(self, reader, writer):
+        self.last_activity = time.time()
+        try:
+            command = json_codec.loads(await reader.readline())
+            data = b""
+            if command["cmd"] == "start":
+                header = self.start(command)
+            elif command["cmd"] == "read":
+                header, data = self.read(command)
+            elif command["cmd"] == "release":
+                header = self.release(command)
+            else:
+                header = {"ok": True, "engine": self.engine.name}
+        except ValueError:
+            # 命令超过 COMMAND_LIMIT 或无法解析：回复失败，由客户端回退到 curl
+            header, data = {"ok": False}, b""
+        except OSError:
+            writer.close()
+            return
+        try:
+            writer.write(json_codec.dumps(header).encode("utf-8") + b"\n" + data)
+            await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(socket_path):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    daemon = StreamDaemon(make_engine())
+    server = await asyncio.start_unix_server(
+        daemon.handle, path=socket_path, limit=COMMAND_LIMIT
+    )
+    try:
+        while not daemon.collect():
+            await asyncio.sleep(30)
+    finally:
+        server.close()
+        await server.wait_closed()
+        await daemon.engine.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(sys.argv[1]))
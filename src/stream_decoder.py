@@ -0,0 +1,145 @@
+"""
+流式响应的统一分帧：SSE、NDJSON 与 JSON 数组流。
+
+分帧函数逐行增量处理，并把未结束的事件保存在 state 中（只保存字符串等不可变值）；
+每解出一个事件就调用服务商的 handle_event(state, event, payload, pieces)：
+  - payload 是解析后的 JSON，无法解析时为原始字符串（例如 SSE 的 [DONE]）；
+  - 新增的文本追加到 pieces 中，由分帧函数在本批结束时一次性拼接到 state["text"]，
+    避免每个分片都复制一遍已累积的全文；需要整体替换文本（如报错）时先清空 pieces；
+  - 返回 True 表示流已结束，之后的内容全部忽略。
+final=True 表示之后不会再有数据，需要冲刷尚未结束的事件。
+"""
+
+import json_codec
+
+
+def parse_payload(text):
+    try:
+        return json_codec.loads(text)
+    except ValueError:
+        return text
+
+
+def finish_batch(state, pieces, closed):
+    if pieces:
+        state["text"] += "".join(pieces)
+    if closed:
+        state["closed"] = True
+
+
+def decode_sse(state, lines, final, handle_event):
+    if state.get("closed"):
+        return
+    pieces = []
+    closed = False
+    event = state.get("sse_event", "")
+    # None 表示当前事件还没有 data 字段；多行 data 以换行拼接
+    data = state.get("sse_data")
+
+    for line in lines:
+        if line.endswith("\r"):
+            line = line[:-1]
+        if not line:
+            if data is not None:
+                closed = handle_event(state, event or "message", parse_payload(data), pieces)
+                if closed:
+                    break
+            event, data = "", None
+            continue
+        if line[0] == ":":
+            # 注释行（心跳或 :HTTP_STATUS/200 之类的附加信息）
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            if data is not None:
+                # 部分 OpenAI 兼容服务的事件之间没有空行：已缓冲的 data 本身完整时先分发，
+                # 否则视为同一事件的续行
+                payload = parse_payload(data)
+                if data == "[DONE]" or not isinstance(payload, str):
+                    closed = handle_event(state, event or "message", payload, pieces)
+                    event, data = "", None
+                    if closed:
+                        break
+            data = value if data is None else f"{data}\n{value}"
+        elif field == "event":
+            event = value
+
+    if closed:
+        event, data = "", None
+    elif final and data is not None:
+        closed = handle_event(state, event or "message", parse_payload(data), pieces)
+        event, data = "", None
+    state["sse_event"], state["sse_data"] = event, data
+    finish_batch(state, pieces, closed)
+
+
+def decode_ndjson(state, lines, final, handle_event):
+    if state.get("closed"):
+        return
+    pieces = []
+    closed = False
+    for line in lines:
+        if not line.strip():
+            continue
+        payload = parse_payload(line)
+        if isinstance(payload, str):
+            # 被截断的残行，等读到完整内容后再解析
+            continue
+        closed = handle_event(state, "message", payload, pieces)
+        if closed:
+            break
+    finish_batch(state, pieces, closed)
+
+
+def decode_json_array(state, lines, final, handle_event):
+    """
+    形如 [{...}\\r\\n,\\r\\n{...}] 的数组流，元素之间以单独一行的 "," 分隔。
+    读到数组结尾 ] 且最后一个元素完整时，额外发出一个 "end" 事件。
+    """
+    if state.get("closed"):
+        return
+    pieces = []
+    closed = False
+    part = state.get("array_part", "")
+
+    def dispatch(part):
+        part = part.strip()
+        if not part:
+            return False
+        if part.startswith("["):
+            part = part[1:]
+        ending = part.endswith("]")
+        if ending:
+            part = part[:-1]
+        try:
+            payload = json_codec.loads(part)
+        except ValueError:
+            # 尾行可能恰好停在元素内部某个数组的 ] 上，只有能完整解析时才算结束
+            return False
+        stop = handle_event(state, "message", payload, pieces)
+        if ending:
+            stop = handle_event(state, "end", None, pieces) or stop
+        return stop
+
+    for line in lines:
+        if line.strip() == ",":
+            closed = dispatch(part)
+            part = ""
+            if closed:
+                break
+        else:
+            part += line
+    if not closed and final:
+        closed = dispatch(part)
+        part = ""
+    state["array_part"] = "" if closed else part
+    finish_batch(state, pieces, closed)
+
+
+DECODERS = {
+    "sse": decode_sse,
+    "ndjson": decode_ndjson,
+    "json_array": decode_json_array,
+}